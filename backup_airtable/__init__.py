@@ -0,0 +1,4 @@
+from backup_airtable.api import AsyncAirtableClient
+from backup_airtable.client import AirtableRequestError
+
+__all__ = ["AirtableRequestError", "AsyncAirtableClient"]
@@ -0,0 +1,208 @@
+"""
+An async API for reading from Airtable, for using backup-airtable from your own code instead of the command line. Requests are rate limited, retried, and pooled the same way the CLI's are.
+"""
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from typing import Any, Optional
+
+import httpx
+from httpx import HTTPError, HTTPStatusError
+
+from backup_airtable.client import (
+    API_URL,
+    COMMENT_WORKERS,
+    KEEPALIVE_EXPIRY,
+    MAX_RETRIES,
+    TOKEN_REQUESTS_PER_SECOND,
+    AirtableRequestError,
+    Base,
+    Params,
+    RateLimiter,
+    Table,
+    default_headers,
+    is_retryable,
+    rate_limit_key,
+    retry_delay,
+    timeout,
+)
+
+
+class AsyncAirtableClient:
+    """
+    Reads bases, tables, records, and comments from the Airtable API. Lists are async iterators that fetch a page at a time as they're consumed, so a slow consumer never has more than a page of records waiting on it.
+
+    Use it as an async context manager, so its connections are closed:
+
+        async with AsyncAirtableClient(token) as client:
+            async for base in client.bases():
+                for table in await client.tables(base["id"]):
+                    async for record in client.records(base["id"], table["id"]):
+                        ...
+    """
+
+    def __init__(
+        self,
+        airtable_token: str,
+        *,
+        max_retries: int = MAX_RETRIES,
+        max_connections: int = COMMENT_WORKERS + 1,
+        http2: bool = False,
+        api_url: str = API_URL,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.airtable_token = airtable_token
+        self.max_retries = max_retries
+        self.http_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            headers=default_headers(airtable_token),
+        )
+        # the sync client's limiters, waited on with `asyncio.sleep` instead
+        self.limiter = RateLimiter()
+        self.token_limiter = RateLimiter(rate=TOKEN_REQUESTS_PER_SECOND)
+        # how many retries have been used, across all requests
+        self.retries = 0
+
+    async def __aenter__(self) -> "AsyncAirtableClient":
+        return self
+
+    async def __aexit__(self, *_exc: object):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+    async def _wait(self, key: str):
+        wait = max(
+            self.limiter.reserve(key), self.token_limiter.reserve(self.airtable_token)
+        )
+        if wait:
+            await asyncio.sleep(wait)
+
+    async def get(self, api_path: str, params: Optional[Params] = None) -> Any:
+        """
+        Fetch a path (like `/meta/bases`) and return the parsed body, retrying failures that are probably temporary.
+        """
+        rate_limit = rate_limit_key(api_path)
+        attempt = 0
+        while True:
+            await self._wait(rate_limit)
+            try:
+                response = await self.http_client.get(
+                    f"{self.api_url}{api_path}",
+                    params={k: v for k, v in (params or {}).items() if v is not None},
+                )
+                response.raise_for_status()
+                return json.loads(response.content)
+
+            except HTTPError as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise AirtableRequestError(
+                        str(e),
+                        e.response.status_code
+                        if isinstance(e, HTTPStatusError)
+                        else None,
+                    ) from e
+
+                response = e.response if isinstance(e, HTTPStatusError) else None
+                delay = retry_delay(attempt, response)
+                if response is not None and response.status_code == 429:
+                    # the whole base is being limited, so hold back every request to it
+                    self.limiter.pause(rate_limit, delay)
+                else:
+                    await asyncio.sleep(delay)
+                attempt += 1
+                self.retries += 1
+
+    async def _pages(
+        self, api_path: str, key: str, params: Optional[Params] = None
+    ) -> AsyncIterator[list[dict]]:
+        offset = None
+        while True:
+            data = await self.get(api_path, {**(params or {}), "offset": offset})
+            yield data[key]
+            if not (offset := data.get("offset")):
+                return
+
+    async def bases(self) -> AsyncIterator[Base]:
+        async for page in self._pages("/meta/bases", "bases"):
+            for base in page:
+                yield base  # type: ignore
+
+    async def tables(self, base_id: str) -> list[Table]:
+        """
+        The schema of every table in a base.
+        """
+        return (await self.get(f"/meta/bases/{base_id}/tables"))["tables"]
+
+    async def comments(
+        self, base_id: str, table_id: str, record_id: str
+    ) -> AsyncIterator[dict]:
+        async for page in self._pages(
+            f"/{base_id}/{table_id}/{record_id}/comments", "comments"
+        ):
+            for comment in page:
+                yield comment
+
+    async def _sorted_comments(
+        self, base_id: str, table_id: str, record_id: str, slots: asyncio.Semaphore
+    ) -> list[dict]:
+        async with slots:
+            comments = [c async for c in self.comments(base_id, table_id, record_id)]
+        return sorted(comments, key=lambda c: c["createdTime"])
+
+    async def record_pages(
+        self,
+        base_id: str,
+        table_id: str,
+        *,
+        params: Optional[Params] = None,
+        include_comments: bool = False,
+    ) -> AsyncIterator[list[dict]]:
+        """
+        Each page of a table's records, in the order the API returns them. `params` are passed along to the API (like `{"fields[]": [...]}` or `{"view": "..."}`).
+
+        With `include_comments`, each record gets a `comments` list (oldest first), fetched a few records at a time before its page is yielded.
+        """
+        slots = asyncio.Semaphore(COMMENT_WORKERS)
+        async for page in self._pages(
+            f"/{base_id}/{table_id}",
+            "records",
+            {"recordMetadata": "commentCount", **(params or {})},
+        ):
+            if include_comments:
+                with_comments = [r for r in page if r.get("commentCount")]
+                comments = await asyncio.gather(
+                    *(
+                        self._sorted_comments(base_id, table_id, r["id"], slots)
+                        for r in with_comments
+                    )
+                )
+                by_record = {r["id"]: c for r, c in zip(with_comments, comments)}
+                for record in page:
+                    record["comments"] = by_record.get(record["id"], [])
+            yield page
+
+    async def records(
+        self,
+        base_id: str,
+        table_id: str,
+        *,
+        params: Optional[Params] = None,
+        include_comments: bool = False,
+    ) -> AsyncIterator[dict]:
+        """
+        Every record in a table, one at a time. See `record_pages` for the options.
+        """
+        async for page in self.record_pages(
+            base_id, table_id, params=params, include_comments=include_comments
+        ):
+            for record in page:
+                yield record
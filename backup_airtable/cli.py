@@ -1,132 +1,2618 @@
+import functools
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import lzma
+import os
+import queue
+import sqlite3
+import tarfile
+import threading
 import time
-from datetime import date
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Callable, Iterable, Literal, Optional, Protocol, TypedDict
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    Optional,
+    Protocol,
+    TypedDict,
+    Union,
+)
 
 import click
 import httpx
 from httpx import HTTPError, HTTPStatusError
 
-# airtable occasionally has read timeouts when doing a big export
-# see https://github.com/simonw/airtable-export/pull/14
-timeout = httpx.Timeout(5, read=60)
-http_client = httpx.Client(timeout=timeout)
-# Rate limit is 5req / s. With some overhead for connection time, this is ~ as fast as we can go without hitting limits.
-REQUEST_DELAY = 0.2
+from backup_airtable.client import (
+    API_URL,
+    COMMENT_WORKERS,
+    KEEPALIVE_EXPIRY,
+    MAX_RETRIES,
+    TOKEN_REQUESTS_PER_SECOND,
+    AirtableRequestError,
+    Base,
+    Params,
+    RateLimiter,
+    Table,
+    default_headers,
+    is_retryable,
+    rate_limit_key,
+    retry_delay,
+    timeout,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# adaptive pacing: after each healthy response a base's rate grows by this much (requests / second)...
+PACE_RATE_STEP = 0.25
+# ...and after a 429, a server error, or a response this many times slower than usual, it's halved
+PACE_SLOW_RESPONSE = 3.0
+PACE_MIN_RATE = 0.5
+# responses that were already in flight when a base was slowed down don't slow it down again
+PACE_COOLDOWN = 1.0
+# how many records to hold in memory while their comments are fetched
+COMMENT_BATCH_SIZE = 500
+# how many fetched tables can wait to be written before fetching pauses
+WRITER_QUEUE_SIZE = 2
+# how many attachments to download at once, and how many more can wait for a turn
+ATTACHMENT_WORKERS = 4
+ATTACHMENT_QUEUE_SIZE = 100
+ATTACHMENTS_DIRECTORY = "attachments"
+# how many records to insert into sqlite at once
+SQLITE_BATCH_SIZE = 500
+SQLITE_FILENAME = "backup.sqlite"
+# how much of a previous backup's file to read at once
+READ_CHUNK_SIZE = 64 * 1024
+# incremental backups re-fetch anything modified this long before the previous backup started, in case of clock skew
+INCREMENTAL_OVERLAP = timedelta(minutes=5)
+BACKUP_INFO_FILENAME = "backup-info"
+CHECKPOINT_FILENAME = "checkpoint"
+RUN_REPORT_FILENAME = "run-report"
+MANIFEST_FILENAME = "manifest"
+# how many bases' tables `plan` lists at once
+PLAN_WORKERS = 8
+# records are held here while a table is being fetched
+SPOOL_FILENAME = ".records.spool"
+# how many records' sort keys are kept in memory before being sorted and written out
+SORT_BUFFER_SIZE = 250_000
+
+_ARRAY_SEPARATORS = frozenset(" \t\r\n,")
+
+# fields whose values airtable calculates, so they can be recomputed from the rest of the backup
+# see https://airtable.com/developers/web/api/field-model
+COMPUTED_FIELD_TYPES = frozenset(
+    {
+        "autoNumber",
+        "button",
+        "count",
+        "createdBy",
+        "createdTime",
+        "formula",
+        "lastModifiedBy",
+        "lastModifiedTime",
+        "multipleLookupValues",
+        "rollup",
+    }
+)
+
+
+class BaseResponse(TypedDict):
+    bases: list[Base]
+
+
+class TableResponse(TypedDict):
+    tables: list[Table]
+
+
+class JsonBackend:
+    """
+    Reads and writes JSON with the standard library. Non-ASCII characters are escaped, so files are byte-for-byte the same as ones written by earlier versions.
+    """
+
+    name = "json"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(
+        self, data: Any, *, indent: bool = False, sort_keys: bool = True
+    ) -> bytes:
+        if indent:
+            text = json.dumps(data, indent=2, sort_keys=sort_keys)
+        else:
+            text = json.dumps(data, separators=(",", ":"), sort_keys=sort_keys)
+        return text.encode()
+
+
+class OrjsonBackend(JsonBackend):
+    """
+    Reads and writes JSON with [orjson](https://github.com/ijl/orjson), which is several times faster than the standard library. Anything orjson rejects (like strings with lone surrogates) is handed to the standard library instead.
+
+    The output isn't byte-for-byte the same as `JsonBackend`'s: non-ASCII characters are written as UTF-8 instead of being escaped, floats are written in their shortest form (`1.5e-7` rather than `1.5e-07`), and integers too big for 64 bits are read as floats. So it's only used when asked for (with `--fast-json`).
+    """
+
+    name = "orjson"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return super().loads(data)
+
+    def dumps(
+        self, data: Any, *, indent: bool = False, sort_keys: bool = True
+    ) -> bytes:
+        option = (orjson.OPT_INDENT_2 if indent else 0) | (
+            orjson.OPT_SORT_KEYS if sort_keys else 0
+        )
+        try:
+            return orjson.dumps(data, option=option)
+        except orjson.JSONEncodeError:
+            return super().dumps(data, indent=indent, sort_keys=sort_keys)
+
+
+JSON_BACKENDS: dict[str, type[JsonBackend]] = {
+    "json": JsonBackend,
+    "orjson": OrjsonBackend,
+}
+
+# used for responses and everything the backup writes; see `use_json_backend`
+json_backend: JsonBackend = JsonBackend()
+
+
+def use_json_backend(name: str):
+    """
+    Switch what JSON is read and written with, by name (see `JSON_BACKENDS`).
+    """
+    global json_backend  # noqa: PLW0603 - shared by everything that reads or writes
+    if name == "orjson" and orjson is None:
+        raise click.UsageError(
+            "--fast-json needs the `orjson` package, which is included in the `fast` extra: pipx install 'backup-airtable[fast]'"
+        )
+    json_backend = JSON_BACKENDS[name]()
+
+
+# make an airtable name appropriate for a filepath
+def normalize_name(s: str) -> str:
+    return s.replace(":", "-").replace("/", "|")
+
+
+Compression = Optional[Literal["gzip", "xz"]]
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "xz": ".xz"}
+
+
+def open_file(path: Path, mode: Literal["r", "w", "rb", "wb"]) -> IO:
+    """
+    Open a file, (de)compressing it based on its extension.
+
+    A file opened for writing is always a new one: an existing file may be hardlinked to one in another backup (see `link_if_unchanged`), which writing in place would change too.
+    """
+    if "w" in mode:
+        path.unlink(missing_ok=True)
+    if path.suffix in (".gz", ".xz"):
+        if path.suffix == ".gz":
+            # a fixed mtime keeps the output the same for the same contents
+            f: IO = gzip.GzipFile(path, mode.replace("b", ""), mtime=0)  # noqa: SIM115
+        else:
+            f = lzma.LZMAFile(path, mode.replace("b", ""))  # noqa: SIM115 - caller closes
+        return f if "b" in mode else io.TextIOWrapper(f, encoding="utf-8")
+    return path.open(mode, encoding=None if "b" in mode else "utf-8")
+
+
+def output_path(folder: Path, filename: str, compression: Compression = None) -> Path:
+    return (
+        folder / f"{filename}{COMPRESSION_SUFFIXES[compression] if compression else ''}"
+    )
+
+
+def write_json(
+    folder: Path,
+    filename: str,
+    data,
+    compression: Compression = None,
+    compact: bool = False,
+) -> Path:
+    path = output_path(folder, f"{filename}.json", compression)
+    with open_file(path, "wb") as f:
+        f.write(json_backend.dumps(data, indent=not compact))
+    return path
+
+
+def write_json_array(
+    folder: Path,
+    filename: str,
+    items: Iterable,
+    compression: Compression = None,
+    compact: bool = False,
+) -> Path:
+    """
+    Write items as a JSON array one at a time, so the whole list never has to be in memory. The result is identical to `write_json` with a list.
+    """
+    path = output_path(folder, f"{filename}.json", compression)
+    with open_file(path, "wb") as f:
+        f.write(b"[")
+        empty = True
+        for item in items:
+            if compact:
+                f.write(b"" if empty else b",")
+                f.write(json_backend.dumps(item))
+            else:
+                f.write(b"\n  " if empty else b",\n  ")
+                # strings can't contain raw newlines, so this only indents the structure
+                f.write(json_backend.dumps(item, indent=True).replace(b"\n", b"\n  "))
+            empty = False
+        f.write(b"]" if empty or compact else b"\n]")
+    return path
+
+
+def read_json_array(path: Path) -> Iterator:
+    """
+    Yield the items of a JSON array file (like one written by `write_json_array`) one at a time, without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open_file(path, "r") as f:
+        buffer = f.read(READ_CHUNK_SIZE).lstrip().removeprefix("[")
+        position = 0
+        while True:
+            # skip to the start of the next item
+            while buffer[position : position + 1] in _ARRAY_SEPARATORS:
+                position += 1
+            if buffer.startswith("]", position):
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the next item isn't fully in the buffer yet
+                if not (chunk := f.read(READ_CHUNK_SIZE)):
+                    raise
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield item
+
+
+def write_lines(
+    folder: Path, filename: str, lines: Iterable[bytes], compression: Compression = None
+) -> Path:
+    path = output_path(folder, filename, compression)
+    with open_file(path, "wb") as f:
+        f.writelines(lines)
+    return path
+
+
+def find_file(folder: Path, *filenames: str) -> Optional[Path]:
+    """
+    Find the first of `filenames` in a previous backup, compressed or not.
+    """
+    for filename in filenames:
+        for suffix in ("", *COMPRESSION_SUFFIXES.values()):
+            if (path := folder / f"{filename}{suffix}").exists():
+                return path
+    return None
+
+
+def find_records_file(table_directory: Path) -> Optional[Path]:
+    """
+    Find a table's records in a previous backup, whatever format it was saved in.
+    """
+    return find_file(table_directory, "records.json", "records.ndjson")
+
+
+def read_records(path: Path) -> Iterator[dict]:
+    if ".ndjson" in path.suffixes:
+        with open_file(path, "rb") as f:
+            for line in f:
+                yield json_backend.loads(line)
+    else:
+        yield from read_json_array(path)
+
+
+def json_line(record: dict) -> bytes:
+    # keys are kept in the order airtable sent them
+    return json_backend.dumps(record, sort_keys=False) + b"\n"
+
+
+SortKey = tuple[str, int, int]
+
+
+class RecordSpool:
+    """
+    Holds a table's records in a file next to its `records.json` as pages arrive, keeping only each record's sort key and position in memory. Iterating yields the records back in `createdTime` order.
+
+    Once `sort_buffer` keys have piled up, they're sorted and written to a run file, so memory use stays flat for huge tables. Reading merges the runs back together.
+
+    The file is removed once the table is written. If the backup is interrupted, it's left behind so `resume_from` (the size of the file when it was last checkpointed) can pick it up again.
+    """
+
+    def __init__(
+        self, folder: Path, resume_from: int = 0, sort_buffer: int = SORT_BUFFER_SIZE
+    ):
+        self.path = folder / SPOOL_FILENAME
+        self.sort_buffer = sort_buffer
+        # (createdTime, position, length); position breaks ties, so equal times keep the API order
+        self._index: list[SortKey] = []
+        # sorted keys that didn't fit in `_index`, one file per run
+        self._runs: list[Path] = []
+        self._length = 0
+        self.num_with_comments = 0
+
+        if not resume_from:
+            self._file = self.path.open("w+b")  # noqa: SIM115 - closed on exit
+            return
+
+        self._file = self.path.open("r+b")  # noqa: SIM115 - closed on exit
+        # anything after the checkpoint may be a partial page, so it's fetched again
+        self._file.truncate(resume_from)
+        position = 0
+        for line in self._file:
+            self._add_to_index(json_backend.loads(line), position, len(line))
+            position += len(line)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], *_exc: object):
+        self.close(keep=exc_type is not None)
+
+    def close(self, keep: bool = False):
+        """
+        Close the file, removing it unless `keep` is set (so an interrupted backup can be resumed).
+        """
+        self._file.close()
+        # runs are rebuilt from the spool when resuming, so they're never kept
+        self._remove_runs()
+        if not keep:
+            self.path.unlink()
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def size(self) -> int:
+        """
+        How many bytes have been written. Everything up to here is on disk.
+        """
+        self._file.flush()
+        return self._file.seek(0, os.SEEK_END)
+
+    def _add_to_index(self, record: dict, position: int, length: int):
+        self._index.append((record["createdTime"], position, length))
+        self._length += 1
+        if record.get("commentCount"):
+            self.num_with_comments += 1
+        if len(self._index) >= self.sort_buffer:
+            self._spill()
+
+    def _spill(self):
+        run = self.path.with_name(f"{self.path.name}.run{len(self._runs)}")
+        self._index.sort()
+        with run.open("w") as f:
+            f.writelines(f"{key[0]} {key[1]} {key[2]}\n" for key in self._index)
+        self._runs.append(run)
+        self._index = []
+
+    def _remove_runs(self):
+        for run in self._runs:
+            run.unlink(missing_ok=True)
+        self._runs = []
+
+    @staticmethod
+    def _read_run(run: Path) -> Iterator[SortKey]:
+        with run.open() as f:
+            for line in f:
+                created_time, position, length = line.split()
+                yield created_time, int(position), int(length)
+
+    def extend(self, records: Iterable[dict]):
+        position = self._file.seek(0, os.SEEK_END)
+        for record in records:
+            line = json_line(record)
+            self._add_to_index(record, position, len(line))
+            self._file.write(line)
+            position += len(line)
+
+    def clear(self):
+        self._file.seek(0)
+        self._file.truncate()
+        self._remove_runs()
+        self._index = []
+        self._length = 0
+        self.num_with_comments = 0
+
+    def lines(self) -> Iterator[bytes]:
+        """
+        The records as they were stored (compact JSON, one per line), in `createdTime` order.
+        """
+        self._file.flush()
+        self._index.sort()
+        keys: Iterable[SortKey] = self._index
+        if self._runs:
+            # a k-way merge only holds one key per run in memory
+            keys = heapq.merge(*map(self._read_run, self._runs), self._index)
+        for _, position, length in keys:
+            self._file.seek(position)
+            yield self._file.read(length)
+
+    def __iter__(self) -> Iterator[dict]:
+        for line in self.lines():
+            yield json_backend.loads(line)
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(READ_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_if_unchanged(path: Path, backup_directory: Path, reference: Path) -> bool:
+    """
+    If the file at the same place in the `reference` backup has the same contents as `path`, replace `path` with a hardlink to it so the data is only stored once. Returns whether it did.
+    """
+    reference_file = reference / path.relative_to(backup_directory)
+    if not (
+        reference_file.is_file()
+        # sizes are cheap to compare and rule most changes out
+        and reference_file.stat().st_size == path.stat().st_size
+        and file_hash(reference_file) == file_hash(path)
+    ):
+        return False
+
+    temp_path = path.with_name(f"{path.name}.link")
+    try:
+        os.link(reference_file, temp_path)
+    except OSError:
+        # e.g. the backups are on different drives
+        return False
+    temp_path.replace(path)
+    return True
+
+
+def manifest_files(backup_directory: Path, *paths: Path) -> dict[str, dict]:
+    return {
+        str(path.relative_to(backup_directory)): {
+            "bytes": path.stat().st_size,
+            "sha256": file_hash(path),
+        }
+        for path in paths
+    }
+
+
+@dataclass(frozen=True)
+class Shard:
+    """
+    One of `count` slices of a token's bases, numbered from 1. Bases are assigned by a hash of their id, so every worker agrees on the split without talking to the others and a base stays in the same shard from one run to the next.
+    """
+
+    index: int
+    count: int
+
+    @staticmethod
+    def number_for(base_id: str, count: int) -> int:
+        digest = hashlib.sha256(base_id.encode()).digest()
+        return int.from_bytes(digest[:8], "big") % count + 1
+
+    def includes(self, base: Base) -> bool:
+        return self.number_for(base["id"], self.count) == self.index
+
+    def filename(self, name: str) -> str:
+        """
+        Files at the root of a backup get a shard's number, so shards can share a directory.
+        """
+        return f"{name}-{self.index}-of-{self.count}"
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        index, _, count = value.partition("/")
+        if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+            raise ValueError(f"expected i/n with 1 <= i <= n, got {value!r}")
+        return cls(int(index), int(count))
+
+
+class Manifest:
+    """
+    Lists every table in a backup, along with the size and SHA-256 of every file that was written, so the backup can be checked later with `verify`. A sharded backup writes one per shard, which `merge` combines.
+    """
+
+    def __init__(
+        self,
+        backup_directory: Path,
+        tables: Iterable[dict] = (),
+        shard: Optional[Shard] = None,
+    ):
+        self.backup_directory = backup_directory
+        self.shard = shard
+        self._lock = threading.Lock()
+        self.tables: dict[str, dict] = {t["tableId"]: t for t in tables}
+
+    def table_entry(
+        self, base: Base, table: Table, records: int, paths: list[Path]
+    ) -> dict:
+        return {
+            "baseId": base["id"],
+            "baseName": base["name"],
+            "tableId": table["id"],
+            "tableName": table["name"],
+            "records": records,
+            "files": manifest_files(self.backup_directory, *paths),
+        }
+
+    def add_table(self, entry: dict):
+        with self._lock:
+            self.tables[entry["tableId"]] = entry
+
+    def write(self, *root_files: Path) -> Path:
+        """
+        Write `manifest.json`, including files at the root of the backup (which are only finished at the end).
+        """
+        return write_json(
+            self.backup_directory,
+            self.shard.filename(MANIFEST_FILENAME) if self.shard else MANIFEST_FILENAME,
+            {
+                **({"shard": str(self.shard)} if self.shard else {}),
+                "tables": sorted(
+                    self.tables.values(),
+                    key=lambda t: (t["baseName"], t["tableName"], t["tableId"]),
+                ),
+                "files": manifest_files(
+                    self.backup_directory, *(p for p in root_files if p.exists())
+                ),
+            },
+        )
+
+
+def merge_manifests(backup_directory: Path) -> Path:
+    """
+    Combine the manifests written by every shard of a backup into a single `manifest.json`. Fails if any shard's manifest is missing.
+    """
+    tables: list[dict] = []
+    shards: set[Shard] = set()
+    for path in sorted(backup_directory.glob(f"{MANIFEST_FILENAME}-*-of-*.json")):
+        manifest = json.loads(path.read_text())
+        shards.add(Shard.parse(manifest["shard"]))
+        tables.extend(manifest["tables"])
+
+    if not shards:
+        raise click.ClickException(f"{backup_directory} has no shard manifests")
+    if len(counts := {shard.count for shard in shards}) > 1:
+        raise click.ClickException(
+            f"found manifests from backups split into different numbers of shards: {', '.join(map(str, sorted(counts)))}"
+        )
+    count = counts.pop()
+    if missing := [
+        str(Shard(index, count))
+        for index in range(1, count + 1)
+        if Shard(index, count) not in shards
+    ]:
+        raise click.ClickException(
+            f"missing the manifest for shard(s) {', '.join(missing)}"
+        )
+
+    return Manifest(backup_directory, tables).write(
+        backup_directory / f"{BACKUP_INFO_FILENAME}.json"
+    )
+
+
+def verify_backup(backup_directory: Path, jobs: Optional[int] = None) -> list[str]:
+    """
+    Check every file listed in a backup's manifest, hashing several at once. Returns a description of each problem found.
+    """
+    manifest = json.loads((backup_directory / f"{MANIFEST_FILENAME}.json").read_text())
+    expected: dict[str, dict] = {
+        **{
+            name: info
+            for table in manifest["tables"]
+            for name, info in table["files"].items()
+        },
+        **manifest["files"],
+    }
+
+    problems = []
+    to_hash = []
+    for name, info in sorted(expected.items()):
+        path = backup_directory / name
+        if not path.is_file():
+            problems.append(f"{name} is missing")
+        # sizes are cheap to check, so only files that match are hashed
+        elif (size := path.stat().st_size) != info["bytes"]:
+            problems.append(f"{name} is {size} bytes, but should be {info['bytes']}")
+        else:
+            to_hash.append(name)
+
+    # hashing is CPU-bound, so it's spread across processes rather than threads
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        hashes = pool.map(file_hash, [backup_directory / name for name in to_hash])
+        problems.extend(
+            f"{name} has been modified"
+            for name, digest in zip(to_hash, hashes)
+            if digest != expected[name]["sha256"]
+        )
+
+    return problems
+
+
+class Archive:
+    """
+    Streams a backup into a single tar file. Files are written to the backup directory as usual, then moved into the archive as each table finishes.
+    """
+
+    def __init__(self, path: Path, backup_directory: Path):
+        mode = {".gz": "w|gz", ".tgz": "w|gz", ".xz": "w|xz"}.get(path.suffix, "w|")
+        self.path = path
+        self.backup_directory = backup_directory
+        self._tar = tarfile.open(str(path), mode)  # noqa: SIM115 - closed in `close`
+        self._lock = threading.Lock()
+
+    def add(self, *paths: Path):
+        with self._lock:
+            for path in paths:
+                # everything goes in a top-level folder, like the backup directory would be
+                self._tar.add(
+                    path,
+                    arcname=str(
+                        Path(self.backup_directory.name)
+                        / path.relative_to(self.backup_directory)
+                    ),
+                )
+                path.unlink()
+
+    def close(self):
+        # files at the root of the backup (like `backup-info.json`) are added last, since they're written throughout
+        self.add(
+            *sorted(
+                p
+                for p in self.backup_directory.iterdir()
+                if p.is_file() and p.resolve() != self.path.resolve()
+            )
+        )
+        self._tar.close()
+
+        # clean up the now-empty folders, deepest first
+        for folder in sorted(
+            (p for p in self.backup_directory.rglob("*") if p.is_dir()),
+            key=lambda p: len(p.parts),
+            reverse=True,
+        ):
+            folder.rmdir()
+        self.backup_directory.rmdir()
+
+    def abort(self):
+        """
+        Remove the unfinished archive. The files already moved into it are gone from the backup directory, so it's no use on its own.
+        """
+        self._tar.close()
+        self.path.unlink(missing_ok=True)
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class SqliteDatabase:
+    """
+    Stores records in a single SQLite database, with a table per Airtable table (named `<base name>/<table name>`). Each has a column per field, plus the raw record as JSON. The `_tables` table lists them all, along with their schemas.
+    """
+
+    # columns every table has; fields with the same name are only available in `record`
+    RECORD_COLUMNS = ("id", "createdTime", "commentCount", "comments", "record")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # tables can be written from several threads at once, but a connection can only do one thing at a time
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS _tables (name TEXT PRIMARY KEY, base_id TEXT, base_name TEXT, table_id TEXT, table_name TEXT, schema TEXT)"
+            )
+
+    def close(self):
+        self._connection.close()
+
+    def write_table(
+        self,
+        base: Base,
+        table: Table,
+        records: Iterable[dict],
+        field_ids: Optional[list[str]] = None,
+    ):
+        """
+        Replace the table's rows with `records`. If `field_ids` is given, only those fields get columns.
+        """
+        name = f"{base['name']}/{table['name']}"
+
+        # field name -> column; sqlite column names aren't case sensitive
+        taken = {c.lower() for c in self.RECORD_COLUMNS}
+        fields: list[dict] = []
+        for schema_field in table["fields"]:
+            if field_ids is not None and schema_field["id"] not in field_ids:
+                continue
+            if schema_field["name"].lower() not in taken:
+                taken.add(schema_field["name"].lower())
+                fields.append(schema_field)
+
+        columns = [*self.RECORD_COLUMNS, *(f["name"] for f in fields)]
+        insert = f"INSERT INTO {_quote(name)} ({', '.join(map(_quote, columns))}) VALUES ({', '.join('?' * len(columns))})"
+
+        with self._lock, self._connection:
+            self._connection.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+            self._connection.execute(
+                f"CREATE TABLE {_quote(name)} (id TEXT PRIMARY KEY, {', '.join(map(_quote, columns[1:]))})"
+            )
+            self._connection.execute(
+                f"CREATE INDEX {_quote(f'{name}.createdTime')} ON {_quote(name)} (createdTime)"
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO _tables VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    name,
+                    base["id"],
+                    base["name"],
+                    table["id"],
+                    table["name"],
+                    _json_text(table),
+                ),
+            )
+
+        records = iter(records)
+        while batch := list(itertools.islice(records, SQLITE_BATCH_SIZE)):
+            rows = [
+                (
+                    r["id"],
+                    r["createdTime"],
+                    r.get("commentCount"),
+                    _json_text(r["comments"]) if "comments" in r else None,
+                    _json_text(r),
+                    *(
+                        _sqlite_value(
+                            r["fields"].get(f["name"], r["fields"].get(f["id"]))
+                        )
+                        for f in fields
+                    ),
+                )
+                for r in batch
+            ]
+            # one transaction per batch, so the lock isn't held for a whole table
+            with self._lock, self._connection:
+                self._connection.executemany(insert, rows)
+
+
+def _sqlite_value(value: Any) -> Any:
+    # sqlite only has scalars, so lists (linked records, attachments, etc) are stored as JSON
+    if isinstance(value, (list, dict)):
+        return _json_text(value)
+    return value
+
+
+def _json_text(value: Any) -> str:
+    return json_backend.dumps(value).decode()
+
+
+class TablePosition(TypedDict):
+    # where to pick up fetching records, and how much of the spool was written before that
+    offset: str
+    spoolSize: int
+
+
+class Checkpoint:
+    """
+    Tracks progress through a backup in `checkpoint.json`, so an interrupted backup can pick up where it left off: finished tables are skipped and partially fetched ones continue from their last saved page.
+
+    Finished tables (and their manifest entries) are appended to `checkpoint.tables.ndjson` once each, so the checkpoint rewritten after every page only holds the tables in progress.
+
+    The checkpoint also records the backup's `options` (see `BackupOptions.to_json`). Resuming with different ones raises `click.BadParameter`, since the tables already saved would be in a different shape than the rest.
+    """
+
+    def __init__(
+        self,
+        backup_directory: Path,
+        resume: bool = False,
+        filename: str = CHECKPOINT_FILENAME,
+        options: Optional[dict] = None,
+    ):
+        self.path = backup_directory / f"{filename}.json"
+        self.tables_path = backup_directory / f"{filename}.tables.ndjson"
+        self.options = options or {}
+        self._lock = threading.Lock()
+
+        self.completed: set[str] = set()
+        self.in_progress: dict[str, TablePosition] = {}
+        # the manifest entries of completed tables, so they aren't lost when resuming
+        self.manifest_entries: dict[str, dict] = {}
+        if resume and self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data.get("options", {}) != self.options:
+                raise click.BadParameter(
+                    f"{self.path.name} was made with different options; resume with the same --format, --compress, --compact, --include-comments, --fast-json, and field options as the interrupted backup",
+                    param_hint="--resume",
+                )
+            self.in_progress = data["inProgress"]
+            if self.tables_path.exists():
+                self._load_tables()
+        else:
+            self.tables_path.unlink(missing_ok=True)
+            # written up front, so the options are there however early the backup is interrupted
+            self._save()
+
+    def _load_tables(self):
+        data = self.tables_path.read_bytes()
+        # a crash mid-append can leave a partial last line, which is dropped
+        complete = data[: data.rfind(b"\n") + 1]
+        if len(complete) < len(data):
+            with self.tables_path.open("r+b") as f:
+                f.truncate(len(complete))
+        for line in complete.splitlines():
+            table = json.loads(line)
+            self.completed.add(table["tableId"])
+            if table.get("manifestEntry"):
+                self.manifest_entries[table["tableId"]] = table["manifestEntry"]
+
+    def _save(self):
+        # write somewhere else first, so a crash mid-write can't leave a corrupt checkpoint
+        temp_path = self.path.with_suffix(".tmp")
+        temp_path.write_text(
+            json.dumps(
+                {"options": self.options, "inProgress": self.in_progress},
+                indent=2,
+                sort_keys=True,
+            )
+        )
+        temp_path.replace(self.path)
+
+    def is_complete(self, table_id: str) -> bool:
+        return table_id in self.completed
+
+    def position(self, table_id: str) -> Optional[TablePosition]:
+        return self.in_progress.get(table_id)
+
+    def page_saved(self, table_id: str, offset: str, spool_size: int):
+        with self._lock:
+            self.in_progress[table_id] = {"offset": offset, "spoolSize": spool_size}
+            self._save()
+
+    def table_done(self, table_id: str, manifest_entry: Optional[dict] = None):
+        with self._lock:
+            with self.tables_path.open("a") as f:
+                f.write(
+                    json.dumps({"tableId": table_id, "manifestEntry": manifest_entry})
+                    + "\n"
+                )
+            self.completed.add(table_id)
+            if manifest_entry:
+                self.manifest_entries[table_id] = manifest_entry
+            if self.in_progress.pop(table_id, None):
+                self._save()
+
+    def restart_table(self, table_id: str):
+        with self._lock:
+            self.in_progress.pop(table_id, None)
+            self._save()
+
+    def finish(self):
+        """
+        The backup is complete, so there's nothing left to resume.
+        """
+        self.path.unlink(missing_ok=True)
+        self.tables_path.unlink(missing_ok=True)
+
+
+@dataclass
+class Pace:
+    """
+    How fast an `AdaptiveRateLimiter` is currently sending requests for a base.
+    """
+
+    rate: float
+    # a float so it can grow by fractions; the whole part is what's allowed
+    max_in_flight: float
+    in_flight: int = 0
+    # moving average of response times for each sort of request (see `latency_key`), since a page of a wide table takes much longer than a page of comments
+    latency: dict[str, float] = field(default_factory=dict)
+    slowed_at: float = float("-inf")
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    Adjusts each base's rate and how many requests it can have in flight as the backup runs (additive increase, multiplicative decrease). Both grow a little after every healthy response and are halved after a 429, a server error, a dropped connection, or a response that's much slower than usual. Neither goes above where it started, since `rate` is Airtable's actual limit.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: float = 1,
+        max_in_flight: int = COMMENT_WORKERS + 1,
+    ):
+        super().__init__(rate, burst)
+        self.max_in_flight = max_in_flight
+        self._paces: dict[str, Pace] = {}
+        self._in_flight_changed = threading.Condition(self._lock)
+
+    def _pace(self, key: str) -> Pace:
+        # callers hold the lock
+        if key not in self._paces:
+            self._paces[key] = Pace(self.rate, self.max_in_flight)
+        return self._paces[key]
+
+    def _rate(self, key: str) -> float:
+        return self._pace(key).rate
+
+    def acquire(self, key: str) -> None:
+        with self._in_flight_changed:
+            pace = self._pace(key)
+            self._in_flight_changed.wait_for(
+                lambda: pace.in_flight < int(pace.max_in_flight)
+            )
+            pace.in_flight += 1
+        super().acquire(key)
+
+    def release(
+        self, key: str, seconds: float, status: Optional[int], kind: str = ""
+    ) -> None:
+        with self._in_flight_changed:
+            pace = self._pace(key)
+            pace.in_flight -= 1
+
+            failed = status is None or status == 429 or status >= 500
+            latency = pace.latency.get(kind)
+            slow = latency is not None and seconds > latency * PACE_SLOW_RESPONSE
+            if not failed:
+                # slow responses count too, so requests that are just slower than the first few (like a wider table's) soon stop looking slow
+                pace.latency[kind] = (
+                    seconds if latency is None else 0.8 * latency + 0.2 * seconds
+                )
+            if failed or slow:
+                now = time.monotonic()
+                if now - pace.slowed_at >= PACE_COOLDOWN:
+                    pace.slowed_at = now
+                    pace.rate = max(PACE_MIN_RATE, pace.rate / 2)
+                    pace.max_in_flight = max(1, pace.max_in_flight / 2)
+            else:
+                pace.rate = min(self.rate, pace.rate + PACE_RATE_STEP)
+                pace.max_in_flight = min(
+                    self.max_in_flight, pace.max_in_flight + 1 / pace.max_in_flight
+                )
+
+            self._in_flight_changed.notify_all()
+
+    def describe(self, key: str) -> str:
+        with self._lock:
+            pace = self._pace(key)
+            return f"{round(pace.rate, 2):g} requests/s, up to {int(pace.max_in_flight)} at once"
+
+
+class FetchFn(Protocol):
+    def __call__(self, path: str, params: Optional[Params] = None, /) -> Any: ...
+
+
+fetch_fn = Callable[[str, Optional[Params]], Any]
+
+
+def latency_key(api_path: str) -> str:
+    """
+    Which requests have response times worth comparing: pages of the same table, comments on the same table's records, or metadata.
+    """
+    if api_path.startswith("/meta/"):
+        return "meta"
+    base_id, table_id, *rest = api_path.strip("/").split("/")
+    return f"{base_id}/{table_id}" + ("/comments" if rest else "")
+
+
+def request_kind(api_path: str) -> str:
+    """
+    What sort of request a path is, for grouping stats: `meta`, `records`, or `comments`.
+    """
+    if api_path.startswith("/meta/"):
+        return "meta"
+    return "comments" if api_path.endswith("/comments") else "records"
+
+
+@dataclass
+class RequestStats:
+    # every attempt, including ones that failed and were retried
+    count: int = 0
+    # attempts that got a 2xx response
+    ok: int = 0
+    retries: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    # time spent waiting on rate limiters before sending
+    wait_seconds: float = 0.0
+    statuses: dict[str, int] = field(default_factory=dict)
+
+    def add(
+        self,
+        status: str,
+        seconds: float,
+        num_bytes: int,
+        wait_seconds: float,
+        retry: bool,
+    ):
+        self.count += 1
+        self.ok += status.startswith("2")
+        self.retries += retry
+        self.bytes += num_bytes
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.wait_seconds += wait_seconds
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def to_json(self) -> dict:
+        return {
+            "count": self.count,
+            "ok": self.ok,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "maxSeconds": round(self.max_seconds, 3),
+            "waitSeconds": round(self.wait_seconds, 3),
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+@dataclass
+class TableStats:
+    base: Base
+    table: Table
+    records: int = 0
+    # downloading records into the spool
+    fetch_seconds: float = 0.0
+    # waiting on records (and their comments) while writing them out
+    comments_seconds: float = 0.0
+    # serializing and writing, not counting the above
+    write_seconds: float = 0.0
+    bytes_written: int = 0
+
+
+def _prometheus_labels(**labels: str) -> str:
+    def _escape(value: str) -> str:
+        return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class RunMetrics:
+    """
+    Collects stats about every request and table in a backup, to write to `run-report.json` and (optionally) a Prometheus textfile.
+    """
+
+    def __init__(self):
+        self.started_time = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests: dict[str, RequestStats] = {}
+        # table id -> kind -> stats
+        self.table_requests: dict[str, dict[str, RequestStats]] = {}
+        self.tables: list[TableStats] = []
+        # set once attachments have been downloaded, if they were
+        self.attachments: Optional[dict] = None
+
+    def record_request(
+        self,
+        api_path: str,
+        status: str,
+        seconds: float,
+        num_bytes: int,
+        wait_seconds: float = 0.0,
+        retry: bool = False,
+    ):
+        kind = request_kind(api_path)
+        with self._lock:
+            stats = [self.requests.setdefault(kind, RequestStats())]
+            if kind != "meta":
+                table_id = api_path.split("/")[2]
+                table_requests = self.table_requests.setdefault(table_id, {})
+                stats.append(table_requests.setdefault(kind, RequestStats()))
+            for s in stats:
+                s.add(status, seconds, num_bytes, wait_seconds, retry)
+
+    def table_done(self, stats: TableStats):
+        with self._lock:
+            self.tables.append(stats)
+
+    def report(self, success: bool = True) -> dict:
+        tables = sorted(
+            self.tables, key=lambda t: (t.base["name"], t.table["name"], t.table["id"])
+        )
+        return {
+            "success": success,
+            "startedTime": self.started_time.isoformat(),
+            "seconds": round(time.monotonic() - self._started, 3),
+            "records": sum(t.records for t in tables),
+            "requests": {
+                kind: stats.to_json() for kind, stats in sorted(self.requests.items())
+            },
+            "tables": [
+                {
+                    "baseId": t.base["id"],
+                    "baseName": t.base["name"],
+                    "tableId": t.table["id"],
+                    "tableName": t.table["name"],
+                    "records": t.records,
+                    "pages": self._table_request(t, "records").ok,
+                    "commentRequests": self._table_request(t, "comments").count,
+                    "fetchSeconds": round(t.fetch_seconds, 3),
+                    "commentsSeconds": round(t.comments_seconds, 3),
+                    "writeSeconds": round(t.write_seconds, 3),
+                    "bytesWritten": t.bytes_written,
+                    "requests": {
+                        kind: stats.to_json()
+                        for kind, stats in sorted(
+                            self.table_requests.get(t.table["id"], {}).items()
+                        )
+                    },
+                }
+                for t in tables
+            ],
+            **({"attachments": self.attachments} if self.attachments else {}),
+        }
+
+    def _table_request(self, stats: TableStats, kind: str) -> RequestStats:
+        return self.table_requests.get(stats.table["id"], {}).get(kind, RequestStats())
+
+    def prometheus(self, success: bool = True) -> str:
+        """
+        The run's stats in Prometheus' text format, for node_exporter's textfile collector.
+        """
+        report = self.report(success)
+        metrics: dict[str, tuple[str, list[tuple[str, float]]]] = {}
+
+        def add(name: str, help_text: str, value: float, **labels: str):
+            samples = metrics.setdefault(f"backup_airtable_{name}", (help_text, []))[1]
+            samples.append((_prometheus_labels(**labels) if labels else "", value))
+
+        add("success", "Whether the last backup finished", int(success))
+        add(
+            "started_timestamp_seconds",
+            "When the last backup started",
+            self.started_time.timestamp(),
+        )
+        add("duration_seconds", "How long the last backup took", report["seconds"])
+        add("records", "Records saved by the last backup", report["records"])
+        for kind, stats in sorted(self.requests.items()):
+            for status, count in sorted(stats.statuses.items()):
+                add("requests", "Requests made", count, kind=kind, status=status)
+            add("retries", "Requests that were retries", stats.retries, kind=kind)
+            add("response_bytes", "Size of response bodies", stats.bytes, kind=kind)
+            add("request_seconds", "Time spent on requests", stats.seconds, kind=kind)
+            add(
+                "rate_limit_wait_seconds",
+                "Time spent waiting on rate limits",
+                stats.wait_seconds,
+                kind=kind,
+            )
+        for table in report["tables"]:
+            labels = {"base": table["baseName"], "table": table["tableName"]}
+            add("table_records", "Records saved per table", table["records"], **labels)
+            for phase in ("fetch", "comments", "write"):
+                add(
+                    "table_seconds",
+                    "Time spent on each phase of a table",
+                    table[f"{phase}Seconds"],
+                    phase=phase,
+                    **labels,
+                )
+
+        lines = []
+        for name, (help_text, samples) in metrics.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{labels} {value}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+def write_run_report(
+    backup_directory: Path,
+    metrics: RunMetrics,
+    prometheus_textfile: Optional[Path] = None,
+    success: bool = True,
+    filename: str = RUN_REPORT_FILENAME,
+):
+    write_json(backup_directory, filename, metrics.report(success))
+    if prometheus_textfile:
+        # the collector may read at any time, so swap the whole file in at once
+        temp_path = prometheus_textfile.with_name(f"{prometheus_textfile.name}.tmp")
+        temp_path.write_text(metrics.prometheus(success))
+        temp_path.replace(prometheus_textfile)
+
+
+class AirtableClient:
+    """
+    Makes rate-limited GET requests to the Airtable API, retrying ones that fail for transient reasons. Calling it fetches a path and returns the parsed body.
+    """
+
+    def __init__(
+        self,
+        airtable_token: str,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = MAX_RETRIES,
+        metrics: Optional[RunMetrics] = None,
+        api_url: str = API_URL,
+        http_client: Optional[httpx.Client] = None,
+    ):
+        self.airtable_token = airtable_token
+        self.api_url = api_url
+        self.http_client = http_client or httpx.Client(
+            timeout=timeout, headers=default_headers(airtable_token)
+        )
+        self.metrics = metrics
+        self.limiter = limiter or RateLimiter()
+        self.token_limiter = RateLimiter(rate=TOKEN_REQUESTS_PER_SECOND)
+        self.max_retries = max_retries
+        # how many retries have been used, across all requests
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+
+    def close(self):
+        self.http_client.close()
+
+    def __call__(self, api_path: str, params: Optional[Params] = None):
+        assert api_path.startswith("/")
+        assert "api.airtable.com" not in api_path
+
+        rate_limit = rate_limit_key(api_path)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            self.limiter.acquire(rate_limit)
+            self.token_limiter.acquire(self.airtable_token)
+            sent = time.monotonic()
+
+            try:
+                status = None
+                try:
+                    response = self.http_client.get(
+                        f"{self.api_url}{api_path}",
+                        # remove `None` keys from params dict to make calling this easier
+                        params={
+                            k: v for k, v in (params or {}).items() if v is not None
+                        },
+                    )
+                    status = response.status_code
+                finally:
+                    self.limiter.release(
+                        rate_limit,
+                        time.monotonic() - sent,
+                        status,
+                        latency_key(api_path),
+                    )
+
+                if self.metrics:
+                    self.metrics.record_request(
+                        api_path,
+                        str(response.status_code),
+                        time.monotonic() - sent,
+                        len(response.content),
+                        sent - start,
+                        retry=attempt > 0,
+                    )
+                response.raise_for_status()
+                return json_backend.loads(response.content)
+
+            except HTTPError as e:
+                if self.metrics and not isinstance(e, HTTPStatusError):
+                    # no response, so it wasn't recorded above
+                    self.metrics.record_request(
+                        api_path,
+                        "error",
+                        time.monotonic() - sent,
+                        0,
+                        sent - start,
+                        retry=attempt > 0,
+                    )
+
+                if attempt < self.max_retries and is_retryable(e):
+                    response = e.response if isinstance(e, HTTPStatusError) else None
+                    delay = retry_delay(attempt, response)
+                    if response is not None and response.status_code == 429:
+                        # the whole base is being limited, so hold back every request to it
+                        self.limiter.pause(rate_limit, delay)
+                    else:
+                        time.sleep(delay)
+
+                    attempt += 1
+                    with self._retries_lock:
+                        self.retries += 1
+                    continue
+
+                print("\n")
+
+                message = f"{str(e)}\n"
+
+                # permissions issue would be the trickiest to catch, so flag those especially
+                if isinstance(e, HTTPStatusError) and e.response.status_code == 403:
+                    message += (
+                        "\nHINT: Ensure your token has the correct permissions!\n"
+                    )
+
+                raise AirtableRequestError(
+                    message,
+                    e.response.status_code if isinstance(e, HTTPStatusError) else None,
+                ) from e
+
+
+def build_client(
+    airtable_token: str,
+    limiter: Optional[RateLimiter] = None,
+    max_retries: int = MAX_RETRIES,
+    metrics: Optional[RunMetrics] = None,
+    api_url: str = API_URL,
+    concurrency: int = 1,
+    http2: bool = False,
+) -> AirtableClient:
+    # every table being backed up can have a page of records and a batch of comments in flight at once
+    connections = concurrency * (COMMENT_WORKERS + 1)
+    try:
+        http_client = httpx.Client(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=connections,
+                max_keepalive_connections=connections,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            headers=default_headers(airtable_token),
+        )
+    except ImportError as e:
+        raise click.UsageError(
+            "--http2 needs the `h2` package, which is included in the `http2` extra: pipx install 'backup-airtable[http2]'"
+        ) from e
+
+    return AirtableClient(
+        airtable_token,
+        limiter=limiter,
+        max_retries=max_retries,
+        metrics=metrics,
+        api_url=api_url,
+        http_client=http_client,
+    )
+
+
+class LogFn(Protocol):
+    def __call__(
+        self, *values: object, end: str = "\n", flush: bool = False
+    ) -> Any: ...
+
+
+def _silent(*_values: object, **_kwargs: Any) -> None:
+    pass
+
+
+class LogBuffer:
+    """
+    A `LogFn` that holds on to what's logged, so output from a background thread can be printed in one go instead of interleaved with the main thread's.
+    """
+
+    def __init__(self):
+        self._parts: list[str] = []
+
+    def __call__(self, *values: object, end: str = "\n", flush: bool = False):  # noqa: ARG002
+        self._parts.append(" ".join(map(str, values)) + end)
+
+    def getvalue(self) -> str:
+        return "".join(self._parts)
+
+
+def _load_all_items(
+    fetch: FetchFn,
+    path: str,
+    sub_key: Literal["comments", "records"],
+    params: Optional[Params] = None,
+    log: LogFn = print,
+) -> Iterable:
+    for page in _load_all_pages(fetch, path, sub_key, params, log=log):
+        yield from page
+
+
+def _paginate(
+    fetch: FetchFn,
+    path: str,
+    sub_key: Literal["comments", "records"],
+    params: Optional[Params] = None,
+    offset: Optional[str] = None,
+    log: LogFn = print,
+) -> Iterator[tuple[list, Optional[str]]]:
+    """
+    Yield each page of results along with the offset of the page after it (if there is one). Starts at `offset`, if given.
+    """
+    if params is None:
+        params = {}
+
+    # no do...while, but can't set `offset` to something because it gets passed to airtable
+    first = True
+    while first or offset:
+        first = False
+
+        data = fetch(path, {"offset": offset, **params})
+        log(".", end="", flush=True)  # little progress bar-type thing
+        offset = data.get("offset")
+
+        # each response has info, plus a top-level key with a list of results
+        yield data[sub_key], offset
+
+
+def _load_all_pages(
+    fetch: FetchFn,
+    path: str,
+    sub_key: Literal["comments", "records"],
+    params: Optional[Params] = None,
+    log: LogFn = print,
+) -> Iterator[list]:
+    for page, _ in _paginate(fetch, path, sub_key, params, log=log):
+        yield page
+
+
+def load_record_pages(
+    fetch: FetchFn,
+    base_id: str,
+    table_id: str,
+    offset: Optional[str] = None,
+    params: Optional[Params] = None,
+    log: LogFn = print,
+) -> Iterator[tuple[list, Optional[str]]]:
+    return _paginate(
+        fetch,
+        f"/{base_id}/{table_id}",
+        "records",
+        {"recordMetadata": "commentCount", **(params or {})},
+        offset=offset,
+        log=log,
+    )
+
+
+def load_all_records(
+    fetch: FetchFn, base_id: str, table_id: str, log: LogFn = print
+) -> Iterable:
+    return _load_all_items(
+        fetch,
+        f"/{base_id}/{table_id}",
+        "records",
+        {"recordMetadata": "commentCount"},
+        log=log,
+    )
+
+
+def load_all_comments(
+    fetch: FetchFn, base_id: str, table_id: str, record_id: str, log: LogFn = print
+) -> Iterable:
+    return _load_all_items(
+        fetch, f"/{base_id}/{table_id}/{record_id}/comments", "comments", log=log
+    )
+
+
+def load_comments_for_records(
+    fetch: FetchFn, base_id: str, table_id: str, records: list, log: LogFn = print
+) -> None:
+    """
+    Fetch comments for every record that has any, a few records at a time, and attach them (oldest first) to each record. Records without comments get an empty list. Records that already have comments attached are left alone.
+    """
+    record_ids = [
+        r["id"] for r in records if r.get("commentCount") and "comments" not in r
+    ]
+
+    def _load(record_id: str) -> list:
+        return sorted(
+            load_all_comments(fetch, base_id, table_id, record_id, log=log),
+            key=lambda c: c["createdTime"],
+        )
+
+    # requests still go through the base's rate limiter; the pool just keeps several in flight
+    with ThreadPoolExecutor(max_workers=COMMENT_WORKERS) as pool:
+        comments_by_record = dict(zip(record_ids, pool.map(_load, record_ids)))
+
+    for record in records:
+        if "comments" not in record:
+            record["comments"] = comments_by_record.get(record["id"], [])
+
+
+# record id -> (commentCount, comments)
+CommentCache = dict[str, tuple[int, list]]
+
+
+def load_comment_cache(table_directory: Path) -> CommentCache:
+    """
+    Read the comments out of a table in a previous backup, so they don't need to be downloaded again.
+    """
+    if not (records_file := find_records_file(table_directory)):
+        return {}
+
+    return {
+        record["id"]: (record["commentCount"], record["comments"])
+        for record in read_records(records_file)
+        if record.get("commentCount") and "comments" in record
+    }
+
+
+def _with_comments(
+    fetch: FetchFn,
+    base_id: str,
+    table_id: str,
+    records: Iterable[dict],
+    comment_cache: Optional[CommentCache] = None,
+    log: LogFn = print,
+) -> Iterator[dict]:
+    # work in batches so only a batch of records (and their comments) is in memory at once
+    records = iter(records)
+    while batch := list(itertools.islice(records, COMMENT_BATCH_SIZE)):
+        if comment_cache:
+            for record in batch:
+                # the api only gives a count, so a matching count is taken to mean the comments are current; edits, or a comment added and another deleted, go unnoticed
+                cached = comment_cache.get(record["id"])
+                if cached and cached[0] == record.get("commentCount"):
+                    record["comments"] = cached[1]
+
+        load_comments_for_records(fetch, base_id, table_id, batch, log=log)
+        yield from batch
+
+
+OutputFormat = Literal["json", "ndjson", "sqlite"]
+
+
+@dataclass(frozen=True)
+class FieldSelection:
+    """
+    Which fields to download for each table. `include` and `exclude` are `(table id, field name or id)` pairs.
+    """
+
+    include: tuple[tuple[str, str], ...] = ()
+    exclude: tuple[tuple[str, str], ...] = ()
+    skip_computed: bool = False
+    by_id: bool = False
+
+    def fields_for(self, table: Table) -> Optional[list[str]]:
+        """
+        The ids of the fields to request for `table`, or `None` if it should have all of them. Raises `click.BadParameter` if an included or excluded field isn't in the table, or if no fields are left.
+        """
+        include = {field for table_id, field in self.include if table_id == table["id"]}
+        exclude = {field for table_id, field in self.exclude if table_id == table["id"]}
+
+        # a typo would otherwise quietly back up the wrong fields
+        known = {name for f in table["fields"] for name in (f["id"], f["name"])}
+        for option, fields in (
+            ("--include-field", include),
+            ("--exclude-field", exclude),
+        ):
+            if unknown := sorted(fields - known):
+                raise click.BadParameter(
+                    f"table {table['name']} ({table['id']}) has no field(s) named {', '.join(map(repr, unknown))}",
+                    param_hint=repr(option),
+                )
+
+        def _wanted(field: dict) -> bool:
+            names = {field["id"], field["name"]}
+            if names & exclude:
+                return False
+            if include:
+                # explicitly included fields are kept, even if they're computed
+                return bool(names & include)
+            # the primary field is what identifies a record, so it's kept regardless
+            return not (
+                self.skip_computed
+                and field["type"] in COMPUTED_FIELD_TYPES
+                and field["id"] != table["primaryFieldId"]
+            )
+
+        fields = [f["id"] for f in table["fields"] if _wanted(f)]
+        if not fields:
+            # asking for no fields gets all of them from the api
+            raise click.BadParameter(
+                f"every field of table {table['name']} ({table['id']}) is excluded",
+                param_hint="'--exclude-field'",
+            )
+        if len(fields) == len(table["fields"]):
+            return None
+        return fields
+
+    def check(self, tables: Iterable[Table], every_table: bool = True):
+        """
+        Raise `click.BadParameter` if a field to include or exclude isn't in its table, so a typo stops the backup before any records are fetched. With `every_table`, `tables` are all there are, so a table id that isn't one of them is a typo too.
+        """
+        tables = {table["id"]: table for table in tables}
+        for option, pairs in (
+            ("--include-field", self.include),
+            ("--exclude-field", self.exclude),
+        ):
+            if every_table and (
+                unknown := sorted({table_id for table_id, _ in pairs} - tables.keys())
+            ):
+                raise click.BadParameter(
+                    f"there's no table with id {', '.join(map(repr, unknown))}",
+                    param_hint=repr(option),
+                )
+        for table in tables.values():
+            self.fields_for(table)
+
+    def params(self, table: Table) -> Params:
+        return {
+            "fields[]": self.fields_for(table),
+            "returnFieldsByFieldId": "true" if self.by_id else None,
+        }
+
+    def to_json(self) -> dict:
+        # stored in backup-info.json so incremental backups can tell whether their records line up
+        return {
+            "include": sorted(map(list, self.include)),
+            "exclude": sorted(map(list, self.exclude)),
+            "skipComputed": self.skip_computed,
+            "byId": self.by_id,
+        }
+
+
+def attachment_fields(table: Table, by_id: bool = False) -> list[str]:
+    """
+    The keys of a table's attachment fields in its records.
+    """
+    return [
+        field["id"] if by_id else field["name"]
+        for field in table["fields"]
+        if field["type"] == "multipleAttachments"
+    ]
+
+
+class AttachmentStore:
+    """
+    Downloads attachments in the background into a folder, with each file named after its attachment id. Airtable never changes the file behind an attachment id, so one that's already in the folder (or in the `previous` backup's) is never downloaded again.
+
+    Records' attachment metadata is kept as-is, so the file for an attachment is `<directory>/<attachment id>`.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        previous: Optional[Path] = None,
+        max_retries: int = MAX_RETRIES,
+        workers: int = ATTACHMENT_WORKERS,
+    ):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.previous = previous
+        self.max_retries = max_retries
+        # attachment urls point at airtable's CDN, which mustn't be sent the token
+        self._client = httpx.Client(
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=workers),
+        )
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        # once this many downloads are waiting, adding more blocks until one finishes
+        self._slots = threading.BoundedSemaphore(workers + ATTACHMENT_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        # the same attachment can be in several records (or fields)
+        self._seen: set[str] = set()
+        self.downloaded = 0
+        self.reused = 0
+        self.bytes = 0
+        self.failed: list[str] = []
+
+    def path(self, attachment_id: str) -> Path:
+        return self.directory / attachment_id
+
+    def collect(self, records: Iterable[dict], keys: list[str]) -> Iterator[dict]:
+        """
+        Pass `records` through, queueing downloads for the attachments in their `keys` fields along the way.
+        """
+        for record in records:
+            for key in keys:
+                for attachment in record["fields"].get(key) or []:
+                    self.add(attachment)
+            yield record
+
+    def add(self, attachment: dict):
+        """
+        Queue an attachment to be downloaded, unless it's already been seen or stored. Blocks while too many downloads are waiting, which holds up whichever thread is saving the table: the writer thread when tables are backed up one at a time, or a table's worker (and the next table it would fetch) with `--concurrency`.
+        """
+        with self._lock:
+            if attachment["id"] in self._seen:
+                return
+            self._seen.add(attachment["id"])
+
+        if self.path(attachment["id"]).exists() or self._link_previous(attachment):
+            with self._lock:
+                self.reused += 1
+            return
+
+        self._slots.acquire()
+        self._pool.submit(self._download, attachment)
+
+    def _link_previous(self, attachment: dict) -> bool:
+        if not self.previous:
+            return False
+        previous_file = self.previous / attachment["id"]
+        if not previous_file.is_file():
+            return False
+        try:
+            os.link(previous_file, self.path(attachment["id"]))
+        except OSError:
+            # e.g. the backups are on different drives
+            return False
+        return True
+
+    def _download(self, attachment: dict):
+        path = self.path(attachment["id"])
+        temp_path = path.with_name(f"{path.name}.part")
+        try:
+            self._stream_to(attachment["url"], temp_path)
+            size = temp_path.stat().st_size
+            if "size" in attachment and size != attachment["size"]:
+                raise OSError(f"expected {attachment['size']} bytes, got {size}")
+            temp_path.replace(path)
+            with self._lock:
+                self.downloaded += 1
+                self.bytes += size
+        except (HTTPError, OSError) as e:
+            temp_path.unlink(missing_ok=True)
+            with self._lock:
+                self.failed.append(
+                    f"{attachment['id']} ({attachment.get('filename', 'unknown')}): {e}"
+                )
+        finally:
+            self._slots.release()
+
+    def _stream_to(self, url: str, path: Path):
+        attempt = 0
+        while True:
+            try:
+                with self._client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    with path.open("wb") as f:
+                        for chunk in response.iter_bytes(READ_CHUNK_SIZE):
+                            f.write(chunk)
+                return
+            except HTTPError as e:  # noqa: PERF203 - retrying
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                time.sleep(
+                    retry_delay(
+                        attempt, e.response if isinstance(e, HTTPStatusError) else None
+                    )
+                )
+                attempt += 1
+
+    def close(self, cancel: bool = False):
+        """
+        Wait for queued downloads to finish, or drop them if `cancel` is set.
+        """
+        self._pool.shutdown(cancel_futures=cancel)
+        self._client.close()
+
+    def stats(self) -> dict:
+        return {
+            "downloaded": self.downloaded,
+            "reused": self.reused,
+            "bytesDownloaded": self.bytes,
+            "failed": len(self.failed),
+        }
+
+
+@dataclass(frozen=True)
+class BackupOptions:
+    include_comments: bool = False
+    format: OutputFormat = "json"
+    compression: Compression = None
+    # the root of a previous backup and when it started, for incremental backups
+    incremental_from: Optional[Path] = None
+    modified_since: Optional[datetime] = None
+    # a previous backup to copy unchanged comments from
+    comments_from: Optional[Path] = None
+    # a previous backup to hardlink identical files to
+    dedupe_against: Optional[Path] = None
+    fields: FieldSelection = FieldSelection()
+    # write JSON files without indentation
+    compact: bool = False
+    # how many records to sort in memory, see `RecordSpool`
+    sort_buffer: int = SORT_BUFFER_SIZE
+    # the name of the `JsonBackend` files are written with
+    json_backend: str = "json"
+
+    def to_json(self) -> dict:
+        # the options that decide what's in the files written, which a resumed backup has to keep
+        return {
+            "includeComments": self.include_comments,
+            "format": self.format,
+            "compression": self.compression,
+            "compact": self.compact,
+            "fields": self.fields.to_json(),
+            "jsonBackend": self.json_backend,
+        }
+
+
+@dataclass
+class BackupRun:
+    """
+    Everything needed to back up a table, besides the table itself.
+    """
+
+    fetch: FetchFn
+    backup_directory: Path
+    options: BackupOptions
+    checkpoint: Optional[Checkpoint] = None
+    archive: Optional[Archive] = None
+    database: Optional[SqliteDatabase] = None
+    metrics: Optional[RunMetrics] = None
+    manifest: Optional[Manifest] = None
+    # shared with `fetch`, to report how fast each base is going
+    limiter: Optional[RateLimiter] = None
+    attachments: Optional[AttachmentStore] = None
+    # the part of the backup being made, if it's split up
+    shard: Optional[Shard] = None
+
+
+def table_path(base: Base, table: Table) -> Path:
+    """
+    Where a table's files live, relative to the root of a backup.
+    """
+    return Path(normalize_name(base["name"]), normalize_name(table["name"]))
+
+
+def _load_changes(
+    fetch: FetchFn,
+    base_id: str,
+    table: Table,
+    spool: RecordSpool,
+    previous_directory: Path,
+    modified_since: datetime,
+    keep_comments: bool = False,
+    params: Optional[Params] = None,
+    log: LogFn = print,
+) -> bool:
+    """
+    Fill `spool` with the previous backup's records, updated with anything that has changed since. Returns `False` if the previous backup can't be used for this table, in which case it should be fetched in full.
+    """
+    previous_records = find_records_file(previous_directory)
+    previous_schema = find_file(previous_directory, "schema.json")
+    if not (previous_records and previous_schema):
+        return False
+    # a schema change (e.g. a new formula) can change records without modifying them
+    with open_file(previous_schema, "r") as f:
+        if json.load(f) != table:
+            return False
+
+    path = f"/{base_id}/{table['id']}"
+
+    # a cheap listing to find deletions and new comment counts; only the primary field comes back
+    comment_counts: dict[str, int] = {}
+    for page in _load_all_pages(
+        fetch,
+        path,
+        "records",
+        {"fields[]": table["primaryFieldId"], "recordMetadata": "commentCount"},
+        log=log,
+    ):
+        for record in page:
+            comment_counts[record["id"]] = record.get("commentCount", 0)
+
+    since = (modified_since - INCREMENTAL_OVERLAP).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    changed_ids: set[str] = set()
+    for page in _load_all_pages(
+        fetch,
+        path,
+        "records",
+        {
+            "filterByFormula": f"OR(IS_AFTER(LAST_MODIFIED_TIME(), '{since}'), IS_AFTER(CREATED_TIME(), '{since}'))",
+            "recordMetadata": "commentCount",
+            **(params or {}),
+        },
+        log=log,
+    ):
+        spool.extend(page)
+        changed_ids.update(r["id"] for r in page)
+
+    for record in read_records(previous_records):
+        if record["id"] in changed_ids or record["id"] not in comment_counts:
+            continue  # updated or deleted
+        # an unmodified record with the same number of comments can keep the ones it had; otherwise they're fetched again later (if they're wanted)
+        if (
+            not keep_comments
+            or record.get("commentCount") != comment_counts[record["id"]]
+        ):
+            record.pop("comments", None)
+        record["commentCount"] = comment_counts[record["id"]]
+        spool.extend([record])
+
+    # anything that's neither changed nor in the old backup means the old backup is incomplete
+    return len(spool) == len(comment_counts)
 
 
-class Base(TypedDict):
-    id: str
-    name: str
-    permissionLevel: str
+def _fetch_all_records(
+    fetch: FetchFn,
+    base_id: str,
+    table_id: str,
+    spool: RecordSpool,
+    checkpoint: Optional[Checkpoint] = None,
+    position: Optional[TablePosition] = None,
+    params: Optional[Params] = None,
+    log: LogFn = print,
+):
+    offset = None
+    if position:
+        log(f"      resuming after {len(spool)} records", end="", flush=True)
+        offset = position["offset"]
+    else:
+        log("      loading records", end="", flush=True)
 
+    try:
+        for page, next_offset in load_record_pages(
+            fetch, base_id, table_id, offset=offset, params=params, log=log
+        ):
+            spool.extend(page)
+            if checkpoint and next_offset:
+                checkpoint.page_saved(table_id, next_offset, spool.size)
+    except AirtableRequestError as e:
+        # airtable only keeps offsets around for a little while, so an old one may have expired
+        if not (position and e.status_code == 422):
+            raise
+        log("      saved position has expired, starting over")
+        spool.clear()
+        if checkpoint:
+            checkpoint.restart_table(table_id)
+        _fetch_all_records(
+            fetch, base_id, table_id, spool, checkpoint, params=params, log=log
+        )
 
-class BaseResponse(TypedDict):
-    bases: list[Base]
 
+def _load_records(
+    run: BackupRun,
+    base: Base,
+    table: Table,
+    spool: RecordSpool,
+    position: Optional[TablePosition],
+    params: Params,
+    log: LogFn = print,
+) -> bool:
+    """
+    Fill `spool` with the table's records, either from the previous backup and changes since or by downloading all of them. Returns whether the previous backup was used.
+    """
+    options = run.options
+    if not position and options.incremental_from and options.modified_since:
+        log("      loading changes", end="", flush=True)
+        if _load_changes(
+            run.fetch,
+            base["id"],
+            table,
+            spool,
+            options.incremental_from / table_path(base, table),
+            options.modified_since,
+            keep_comments=options.include_comments,
+            params=params,
+            log=log,
+        ):
+            return True
+        log("\n      previous backup isn't usable for this table")
+        spool.clear()
 
-class Table(TypedDict):
-    id: str
-    name: str
-    primaryFieldId: str
-    fields: list[dict]  # don't need the details here
+    _fetch_all_records(
+        run.fetch,
+        base["id"],
+        table["id"],
+        spool,
+        run.checkpoint,
+        position,
+        params=params,
+        log=log,
+    )
+    return False
 
 
-class TableResponse(TypedDict):
-    tables: list[Table]
+def _write_records(
+    run: BackupRun,
+    base: Base,
+    table: Table,
+    spool: RecordSpool,
+    records: Iterable[dict],
+) -> Optional[Path]:
+    """
+    Save a table's records in the chosen format, returning the file they were written to (if they have their own).
+    """
+    options = run.options
+    table_directory = run.backup_directory / table_path(base, table)
 
+    if options.format == "sqlite":
+        assert run.database
+        run.database.write_table(base, table, records, options.fields.fields_for(table))
+        return None
 
-# make an airtable name appropriate for a filepath
-def normalize_name(s: str) -> str:
-    return s.replace(":", "-").replace("/", "|")
+    if options.format == "ndjson":
+        return write_lines(
+            table_directory,
+            "records.ndjson",
+            # when nothing is added to them (comments) or read from them (attachments), records can be copied as-is
+            spool.lines() if records is spool else map(json_line, records),
+            options.compression,
+        )
 
+    return write_json_array(
+        table_directory, "records", records, options.compression, options.compact
+    )
 
-def write_json(folder: Path, filename: str, data):
-    (folder / f"{filename}.json").write_text(json.dumps(data, indent=2, sort_keys=True))
 
+def _timed(items: Iterable[dict], stats: TableStats) -> Iterator[dict]:
+    # counts the time spent producing each item, which is separate from the time spent writing it
+    iterator = iter(items)
+    while True:
+        start = time.monotonic()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            stats.comments_seconds += time.monotonic() - start
+        yield item
 
-class FetchFn(Protocol):
-    def __call__(
-        self, path: str, params: Optional[dict[str, str]] = None, /
-    ) -> Any: ...
 
+Job = Callable[[], None]
 
-fetch_fn = Callable[[str, Optional[dict[str, str]]], Any]
 
+class TableWriter:
+    """
+    Saves tables on a background thread, so the next table can be fetched while the last one is written. At most `max_pending` tables wait to be written; past that, `submit` blocks until the writer catches up.
 
-def build_client(airtable_token: str) -> FetchFn:
-    def _api_request(api_path: str, params: Optional[dict[str, str]] = None):
-        assert api_path.startswith("/")
-        assert "api.airtable.com" not in api_path
+    If saving a table fails, the error is raised by the next `submit` (so no more tables are fetched) and by `close`. Tables already waiting are still written. If the main thread fails instead (or is interrupted), tables that haven't started are skipped, calling their `cancel` instead.
+    """
+
+    def __init__(self, max_pending: int = WRITER_QUEUE_SIZE):
+        self._queue: queue.Queue[Optional[tuple[Job, Optional[Job]]]] = queue.Queue(
+            maxsize=max_pending
+        )
+        self._error: Optional[BaseException] = None
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="table-writer")
+        self._thread.start()
+
+    def _run(self):
+        while (item := self._queue.get()) is not None:
+            job, cancel = item
+            if not self._cancelled.is_set():
+                self._run_job(job)
+            elif cancel:
+                self._run_job(cancel)
 
+    def _run_job(self, job: Job):
         try:
-            response = http_client.get(
-                f"https://api.airtable.com/v0{api_path}",
-                headers={
-                    "Authorization": f"Bearer {airtable_token}",
-                    "user-agent": "backup-airtable",
-                },
-                # remove `None` keys from params dict to make calling this easier
-                params={k: v for k, v in (params or {}).items() if v is not None},
+            job()
+        except BaseException as e:  # noqa: BLE001 - raised on the main thread
+            self._error = self._error or e
+
+    def _raise_error(self):
+        if self._error:
+            raise self._error
+
+    def submit(self, job: Job, cancel: Optional[Job] = None):
+        self._raise_error()
+        self._queue.put((job, cancel))
+
+    def close(self):
+        """
+        Wait for every table to be written, then raise the first error there was (if any).
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def cancel(self):
+        """
+        Skip the tables that haven't started writing, and wait for the one that has.
+        """
+        self._cancelled.set()
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], *_exc: object):
+        if exc_type is None:
+            self.close()
+        else:
+            # the original error is more important than any from writing
+            self.cancel()
+
+
+def _save_table(
+    run: BackupRun,
+    base: Base,
+    table: Table,
+    spool: RecordSpool,
+    loaded: bool,
+    stats: TableStats,
+    written: list[Path],
+    log: LogFn = print,
+):
+    """
+    Add comments to a table's fetched records (if they're wanted) and write them out, then finish up the table. Closes `spool`.
+    """
+    options = run.options
+
+    with spool:
+        records: Iterable[dict] = spool
+        if options.include_comments:
+            # only log if we're fetching any comments for this table
+            if spool.num_with_comments:
+                log(
+                    f"\n      loading comments for {spool.num_with_comments} record(s)",
+                    end="",
+                    flush=True,
+                )
+            else:
+                log("\n      no comments for this table", flush=True, end="")
+
+            comment_cache = None
+            if options.comments_from and not loaded:
+                comment_cache = load_comment_cache(
+                    options.comments_from / table_path(base, table)
+                )
+
+            # but, always add the empty lists
+            records = _timed(
+                _with_comments(
+                    run.fetch, base["id"], table["id"], spool, comment_cache, log=log
+                ),
+                stats,
             )
-            response.raise_for_status()
-            return response.json()
 
-        except HTTPError as e:
-            print("\n")
+        if run.attachments and (keys := attachment_fields(table, options.fields.by_id)):
+            records = run.attachments.collect(records, keys)
 
-            message = f"{str(e)}\n"
+        write_start = time.monotonic()
+        if records_file := _write_records(run, base, table, spool, records):
+            written.append(records_file)
+            destination = records_file.name
+        else:
+            assert run.database
+            destination = run.database.path.name
+        stats.write_seconds = time.monotonic() - write_start - stats.comments_seconds
+        stats.records = len(spool)
 
-            # permissions issue would be the trickiest to catch, so flag those especially
-            if isinstance(e, HTTPStatusError) and e.response.status_code == 403:
-                message += "\nHINT: Ensure your token has the correct permissions!\n"
+    stats.bytes_written = sum(path.stat().st_size for path in written)
+    if run.metrics:
+        run.metrics.table_done(stats)
+    manifest_entry = None
+    if run.manifest:
+        # before the files are linked or archived, which may move them
+        manifest_entry = run.manifest.table_entry(base, table, stats.records, written)
+        run.manifest.add_table(manifest_entry)
 
-            raise click.ClickException(message)
+    if options.dedupe_against:
+        for path in written:
+            if link_if_unchanged(path, run.backup_directory, options.dedupe_against):
+                log(
+                    f"\n      {path.name} is unchanged, linked it to the previous backup",
+                    end="",
+                )
 
-    return _api_request
+    if run.archive:
+        run.archive.add(*written)
+    if run.checkpoint:
+        run.checkpoint.table_done(table["id"], manifest_entry)
+    log(f"\n      wrote {destination}")
 
 
-def _load_all_items(
-    fetch: FetchFn,
-    path: str,
-    sub_key: Literal["comments", "records"],
-    params: Optional[dict[str, str]] = None,
-) -> Iterable:
-    if params is None:
-        params = {}
+def _save_in_background(
+    run: BackupRun,
+    base: Base,
+    table: Table,
+    spool: RecordSpool,
+    loaded: bool,
+    stats: TableStats,
+    written: list[Path],
+    log: LogFn = print,
+):
+    # the next table is being fetched meanwhile, so this table's progress is logged once it's done
+    buffer = LogBuffer()
+    try:
+        _save_table(run, base, table, spool, loaded, stats, written, log=buffer)
+    finally:
+        log(f"\n    Saved table: {table['name']}{buffer.getvalue().rstrip()}")
 
-    # no do...while, but can't set `offset` to something because it gets passed to airtable
-    first = True
-    offset = None
-    while first or offset:
-        first = False
 
-        data = fetch(path, {"offset": offset, **params})
-        print(".", end="", flush=True)  # little progress bar-type thing
-        offset = data.get("offset")
+def backup_table(
+    run: BackupRun,
+    base: Base,
+    table: Table,
+    log: LogFn = print,
+    writer: Optional[TableWriter] = None,
+) -> int:
+    """
+    Write a table's `schema.json` and its records (to `records.json`, `records.ndjson`, or the sqlite database), returning the number of records saved. If there's a `writer`, the records are written by it once they've been fetched.
+    """
+    options, checkpoint = run.options, run.checkpoint
 
-        # each response has info, plus a top-level key with a list of results
-        yield from data[sub_key]
-        if offset:
-            time.sleep(REQUEST_DELAY)
+    table_directory = run.backup_directory / table_path(base, table)
+    table_directory.mkdir(parents=True, exist_ok=True)
+
+    schema_file = write_json(
+        table_directory, "schema", table, options.compression, options.compact
+    )
+    params = options.fields.params(table)
+    stats = TableStats(base, table)
 
+    position = checkpoint.position(table["id"]) if checkpoint else None
+    if position and not (table_directory / SPOOL_FILENAME).exists():
+        position = None
 
-def load_all_records(fetch: FetchFn, base_id: str, table_id: str) -> Iterable:
-    return _load_all_items(
-        fetch, f"/{base_id}/{table_id}", "records", {"recordMetadata": "commentCount"}
+    spool = RecordSpool(
+        table_directory,
+        resume_from=position["spoolSize"] if position else 0,
+        sort_buffer=options.sort_buffer,
     )
+    try:
+        fetch_start = time.monotonic()
+        loaded = _load_records(run, base, table, spool, position, params, log=log)
+        stats.fetch_seconds = time.monotonic() - fetch_start
+    except BaseException:
+        spool.close(keep=True)
+        raise
 
+    if writer:
+        log(f"\n      saving {len(spool)} records in the background")
+        writer.submit(
+            functools.partial(
+                _save_in_background,
+                run,
+                base,
+                table,
+                spool,
+                loaded,
+                stats,
+                [schema_file],
+                log=log,
+            ),
+            # an interrupted backup keeps its fetched records, to resume from
+            cancel=functools.partial(spool.close, keep=True),
+        )
+    else:
+        _save_table(run, base, table, spool, loaded, stats, [schema_file], log=log)
 
-def load_all_comments(
-    fetch: FetchFn, base_id: str, table_id: str, record_id: str
-) -> Iterable:
-    return _load_all_items(
-        fetch, f"/{base_id}/{table_id}/{record_id}/comments", "comments"
+    return len(spool)
+
+
+def _pace(run: BackupRun, base: Base) -> str:
+    if isinstance(run.limiter, AdaptiveRateLimiter):
+        return f" [{run.limiter.describe(base['id'])}]"
+    return ""
+
+
+def backup_serially(run: BackupRun, bases: list[Base], ignore_table: tuple[str, ...]):
+    with TableWriter() as writer:
+        _backup_serially(run, bases, ignore_table, writer)
+
+
+def _check_fields(run: BackupRun, table_responses: list[TableResponse]):
+    # a shard only sees its own bases, so it can't tell whether a table id is wrong
+    run.options.fields.check(
+        (table for response in table_responses for table in response["tables"]),
+        every_table=run.shard is None,
+    )
+
+
+def _backup_serially(
+    run: BackupRun,
+    bases: list[Base],
+    ignore_table: tuple[str, ...],
+    writer: TableWriter,
+):
+    print(f"Fetching tables for {len(bases)} base(s)...", end="", flush=True)
+    table_responses: list[TableResponse] = [
+        run.fetch(f"/meta/bases/{base['id']}/tables") for base in bases
+    ]
+    print(" done!")
+    _check_fields(run, table_responses)
+
+    num_bases = len(bases)
+    for base_index, (base, table_response) in enumerate(zip(bases, table_responses)):
+        print(f"  ({base_index + 1}/{num_bases}) Backing up base: {base['name']}")
+
+        tables = table_response["tables"]
+        num_tables = len(tables)
+        for table_index, table in enumerate(tables):
+            if table["id"] in ignore_table:
+                print(
+                    f"    ({table_index + 1}/{num_tables}) Skipping table: {table['name']}"
+                )
+                continue
+
+            if run.checkpoint and run.checkpoint.is_complete(table["id"]):
+                print(
+                    f"    ({table_index + 1}/{num_tables}) Already saved table: {table['name']}"
+                )
+                continue
+
+            print(
+                f"    ({table_index + 1}/{num_tables}) Saving table: {table['name']}{_pace(run, base)}"
+            )
+
+            backup_table(run, base, table, writer=writer)
+
+
+def load_table_estimates(backup_directory: Path) -> dict[str, float]:
+    """
+    How many seconds each table took in a previous backup, by table id. Read from its run report (or reports, if it was sharded).
+    """
+    estimates = {}
+    for path in backup_directory.glob(f"{RUN_REPORT_FILENAME}*.json"):
+        for table in json.loads(path.read_text())["tables"]:
+            estimates[table["tableId"]] = (
+                table["fetchSeconds"] + table["commentsSeconds"] + table["writeSeconds"]
+            )
+    return estimates
+
+
+def longest_first(
+    jobs: list[tuple[Base, Table]], estimates: dict[str, float]
+) -> list[tuple[Base, Table]]:
+    """
+    Order tables so the slowest start first and quicker ones fill in around them, which keeps one big table from running on its own at the end. Tables without an estimate could be any size, so they go first of all.
+    """
+    return sorted(jobs, key=lambda job: -estimates.get(job[1]["id"], float("inf")))
+
+
+def estimate_remaining(estimates: Iterable[float], workers: int) -> float:
+    """
+    Roughly how long it'll take `workers` to get through jobs of these lengths: the work split evenly, unless one job is longer than that.
+    """
+    estimates = list(estimates)
+    return max(sum(estimates) / workers, max(estimates, default=0.0))
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
+
+
+def _timed_backup_table(run: BackupRun, base: Base, table: Table) -> tuple[int, float]:
+    start = time.monotonic()
+    return backup_table(run, base, table, log=_silent), time.monotonic() - start
+
+
+def backup_concurrently(
+    run: BackupRun,
+    bases: list[Base],
+    ignore_table: tuple[str, ...],
+    concurrency: int,
+    estimates: Optional[dict[str, float]] = None,
+):
+    """
+    Back up every table using a pool of `concurrency` threads. Rate limits are per base, so tables from different bases proceed in parallel while tables in the same base share that base's budget.
+
+    If there are `estimates` of how long each table takes (see `load_table_estimates`), the longest tables are started first and progress includes how long is left.
+    """
+    checkpoint = run.checkpoint
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        print(f"Fetching tables for {len(bases)} base(s)...", end="", flush=True)
+        table_responses: list[TableResponse] = list(
+            pool.map(lambda b: run.fetch(f"/meta/bases/{b['id']}/tables"), bases)
+        )
+        _check_fields(run, table_responses)
+
+        jobs: list[tuple[Base, Table]] = [
+            (base, table)
+            for base, table_response in zip(bases, table_responses)
+            for table in table_response["tables"]
+            if table["id"] not in ignore_table
+            and not (checkpoint and checkpoint.is_complete(table["id"]))
+        ]
+        num_jobs = len(jobs)
+        # for the ETA, tables that weren't in the previous backup are assumed to take as long as the average one that was
+        remaining: dict[str, float] = {}
+        if estimates:
+            jobs = longest_first(jobs, estimates)
+            average = sum(estimates.values()) / len(estimates)
+            remaining = {t["id"]: estimates.get(t["id"], average) for _, t in jobs}
+        print(
+            f" done! Backing up {num_jobs} table(s), {concurrency} at a time"
+            + (
+                f" (about {format_duration(estimate_remaining(remaining.values(), concurrency))} based on the previous backup)"
+                if remaining
+                else ""
+            )
+        )
+
+        futures = {
+            pool.submit(_timed_backup_table, run, base, table): (base, table)
+            for base, table in jobs
+        }
+
+        # how long tables are actually taking, compared to their estimates
+        estimated_seconds = actual_seconds = 0.0
+        try:
+            for index, future in enumerate(as_completed(futures)):
+                base, table = futures[future]
+                num_records, seconds = future.result()
+                eta = ""
+                if remaining:
+                    estimated_seconds += remaining.pop(table["id"])
+                    actual_seconds += seconds
+                    left = estimate_remaining(remaining.values(), concurrency)
+                    if left and estimated_seconds:
+                        left *= actual_seconds / estimated_seconds
+                        eta = f", about {format_duration(left)} left"
+                print(
+                    f"  ({index + 1}/{num_jobs}) Saved {base['name']} / {table['name']} ({num_records} records){_pace(run, base)}{eta}"
+                )
+        except BaseException:
+            # don't start new work once something has gone wrong; in-flight tables still finish
+            pool.shutdown(cancel_futures=True)
+            raise
+
+
+def read_backup_started_time(
+    backup_directory: Path, fields: FieldSelection = FieldSelection()
+) -> datetime:
+    info_file = backup_directory / f"{BACKUP_INFO_FILENAME}.json"
+    if not info_file.exists():
+        raise click.BadParameter(
+            f"{backup_directory} is missing {info_file.name}; only backups made with this version or later can be used",
+            param_hint="--incremental-from",
+        )
+    info = json.loads(info_file.read_text())
+    # otherwise, copied records would have different fields than downloaded ones
+    if info.get("fields", FieldSelection().to_json()) != fields.to_json():
+        raise click.BadParameter(
+            f"{backup_directory} was made with different field options; incremental backups need to use the same --include-field, --exclude-field, --skip-computed, and --fields-by-id",
+            param_hint="--incremental-from",
+        )
+    return datetime.fromisoformat(info["startedTime"])
+
+
+def list_bases(
+    fetch: FetchFn, plan_file: Optional[Path] = None, shard: Optional[Shard] = None
+) -> list[Base]:
+    """
+    The bases to back up: everything the token can see, or the ones in a plan, narrowed down to a shard.
+    """
+    if plan_file:
+        print(f"Reading bases from {plan_file}...", end="", flush=True)
+        bases: list[Base] = [
+            {"id": b["id"], "name": b["name"], "permissionLevel": b["permissionLevel"]}
+            for b in json.loads(plan_file.read_text())["bases"]
+        ]
+    else:
+        print("Fetching bases...", end="", flush=True)
+        base_response: BaseResponse = fetch("/meta/bases")
+        bases = base_response["bases"]
+
+    if not shard:
+        print(f" done! Found {len(bases)}")
+        return bases
+
+    shard_bases = [base for base in bases if shard.includes(base)]
+    print(
+        f" done! Found {len(bases)}, {len(shard_bases)} of which are in shard {shard}"
+    )
+    return shard_bases
+
+
+def _attachment_store(
+    backup_directory: Path,
+    attachments_dir: Optional[Path],
+    previous_backup: Optional[Path],
+    max_retries: int,
+) -> AttachmentStore:
+    return AttachmentStore(
+        attachments_dir or backup_directory / ATTACHMENTS_DIRECTORY,
+        # a shared folder already has everything from earlier backups
+        previous=previous_backup / ATTACHMENTS_DIRECTORY
+        if previous_backup and not attachments_dir
+        else None,
+        max_retries=max_retries,
+    )
+
+
+def _finish_attachments(run: BackupRun):
+    assert run.attachments
+    attachments = run.attachments
+    print("Waiting for attachments to download...", end="", flush=True)
+    attachments.close()
+    print(
+        f" done! Downloaded {attachments.downloaded} ({attachments.bytes / 1024 / 1024:.1f} MB), reused {attachments.reused}"
     )
+    for failure in attachments.failed:
+        print(f"  couldn't download {failure}")
+    if run.metrics:
+        run.metrics.attachments = attachments.stats()
+    if run.archive and attachments.directory.is_relative_to(run.backup_directory):
+        run.archive.add(*sorted(attachments.directory.iterdir()))
+
+
+def _table_estimates(previous_backup: Optional[Path]) -> dict[str, float]:
+    if not previous_backup:
+        return {}
+    if not (estimates := load_table_estimates(previous_backup)):
+        print(f"{previous_backup} has no run report, so tables are backed up in order")
+    return estimates
+
+
+def _parse_shard(
+    _ctx: click.Context, _param: click.Parameter, value: Optional[str]
+) -> Optional[Shard]:
+    if value is None:
+        return None
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e)) from e
+
+
+def _parse_table_fields(
+    _ctx: click.Context, _param: click.Parameter, values: tuple[str, ...]
+) -> tuple[tuple[str, str], ...]:
+    pairs = []
+    for value in values:
+        table_id, _, field = value.partition(":")
+        if not (table_id and field):
+            raise click.BadParameter(f"expected TABLE_ID:FIELD, got {value!r}")
+        pairs.append((table_id, field))
+    return tuple(pairs)
+
+
+def _check_conflicts(
+    backup_directory: Path,
+    output_format: OutputFormat,
+    archive: Optional[Path],
+    resume: bool,
+    shard: Optional[Shard],
+):
+    if archive and resume:
+        raise click.UsageError("--resume can't be used with --archive")
+    if shard and output_format == "sqlite":
+        # every shard would write to the same database
+        raise click.UsageError("--shard can't be used with --format sqlite")
+    if shard and archive:
+        # archiving moves the whole backup directory, including other shards' files
+        raise click.UsageError("--shard can't be used with --archive")
+    if archive and archive.resolve().is_relative_to(backup_directory.resolve()):
+        # the archive would be swept into itself, then deleted with the staging area
+        raise click.UsageError("--archive can't be inside BACKUP_DIRECTORY")
+
+
+class DefaultCommandGroup(click.Group):
+    """
+    A group that runs `default_command` when the first argument isn't the name of another command, so `backup-airtable DIRECTORY` keeps working.
+    """
+
+    default_command = "backup"
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if not args or (
+            str(args[0]) not in self.commands and args[0] not in ("--help", "--version")
+        ):
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+    def invoke(self, ctx: click.Context):
+        try:
+            return super().invoke(ctx)
+        except AirtableRequestError as e:
+            raise click.ClickException(e.message) from e
 
 
-@click.command()
+@click.group(cls=DefaultCommandGroup)
+@click.version_option()
+def cli():
+    """
+    Back up Airtable bases to local files. Runs `backup` unless another command is given.
+    """
+
+
+@cli.command()
 @click.version_option()
 @click.argument(
     "backup_directory",
@@ -152,77 +2638,434 @@ def load_all_comments(
     help="Whether to include row comments in the backup. May slow down the backup considerably if many rows have backups.",
     is_flag=True,
 )
-def cli(
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["json", "ndjson", "sqlite"]),
+    default="json",
+    show_default=True,
+    help="How to save records. `json` is a formatted array in `records.json`; `ndjson` is one compact record per line in `records.ndjson`; `sqlite` puts every table in a single `backup.sqlite` database.",
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    help="Write `schema.json` and `records.json` without indentation. They're smaller and faster to write, but harder to read and diff.",
+)
+@click.option(
+    "--include-field",
+    metavar="TABLE_ID:FIELD",
+    multiple=True,
+    callback=_parse_table_fields,
+    help="Only download this field (by name or id) for the table. Can be given multiple times; tables without any are downloaded in full.",
+)
+@click.option(
+    "--exclude-field",
+    metavar="TABLE_ID:FIELD",
+    multiple=True,
+    callback=_parse_table_fields,
+    help="Don't download this field (by name or id) for the table. Can be given multiple times.",
+)
+@click.option(
+    "--skip-computed",
+    is_flag=True,
+    help="Don't download computed fields (formulas, lookups, rollups, etc), other than each table's primary field. Fields passed to --include-field are still downloaded.",
+)
+@click.option(
+    "--fields-by-id",
+    is_flag=True,
+    help="Key each record's `fields` by field id instead of name, so they don't change when a field is renamed.",
+)
+@click.option(
+    "--compress",
+    type=click.Choice(["gzip", "xz"]),
+    help="Compress each file as it's written, adding a `.gz` or `.xz` extension.",
+)
+@click.option(
+    "--archive",
+    type=click.Path(file_okay=True, dir_okay=False, writable=True, path_type=Path),
+    help="Write the whole backup into a single tar file (compressed if it ends in `.gz` or `.xz`) instead of a folder. BACKUP_DIRECTORY is used as a staging area.",
+)
+@click.option(
+    "--dedupe-against",
+    type=click.Path(
+        exists=True, file_okay=False, dir_okay=True, readable=True, path_type=Path
+    ),
+    help="A previous backup directory. Files that are identical to the ones in it are saved as hardlinks, so they don't take up extra space.",
+)
+@click.option(
+    "--incremental-from",
+    type=click.Path(
+        exists=True, file_okay=False, dir_okay=True, readable=True, path_type=Path
+    ),
+    help="A previous backup directory. Only records changed since it was made are downloaded; everything else is copied from it.",
+)
+@click.option(
+    "--reuse-comments-from",
+    type=click.Path(
+        exists=True, file_okay=False, dir_okay=True, readable=True, path_type=Path
+    ),
+    help="A previous backup made with --include-comments. Records whose comment count hasn't changed reuse its comments instead of downloading them again. Defaults to the --incremental-from directory.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted backup in BACKUP_DIRECTORY. Tables that were already saved are skipped and partially downloaded ones pick up where they left off.",
+)
+@click.option(
+    "--max-retries",
+    type=click.IntRange(min=0),
+    default=MAX_RETRIES,
+    show_default=True,
+    help="How many times to retry a request that fails for a temporary reason, like a timeout or being rate limited.",
+)
+@click.option(
+    "--sort-buffer",
+    type=click.IntRange(min=1),
+    default=SORT_BUFFER_SIZE,
+    show_default=True,
+    help="How many records per table to sort in memory. Bigger tables are sorted in chunks on disk, which uses less memory but is a little slower.",
+)
+@click.option(
+    "--prometheus-textfile",
+    type=click.Path(file_okay=True, dir_okay=False, writable=True, path_type=Path),
+    help="Also write the run's stats to this file in Prometheus' text format, for node_exporter's textfile collector. The file should end in `.prom`.",
+)
+@click.option(
+    "--fast-json",
+    is_flag=True,
+    help="Parse and write JSON with orjson, which is several times faster. Its files aren't byte-for-byte the same as the default's (non-ASCII text isn't escaped, for one), so use it for every backup you compare or --dedupe-against. Requires the `fast` extra.",
+)
+@click.option(
+    "--http2",
+    is_flag=True,
+    help="Use HTTP/2, so concurrent requests share a connection. Requires the `http2` extra.",
+)
+@click.option(
+    "--fixed-rate",
+    is_flag=True,
+    help="Always send 5 requests per second to each base, instead of slowing down when Airtable is struggling.",
+)
+@click.option(
+    "--include-attachments",
+    is_flag=True,
+    help="Download the files in attachment fields, not just their details. Files that were downloaded before (into --attachments-dir, or the previous backup's) aren't downloaded again.",
+)
+@click.option(
+    "--attachments-dir",
+    type=click.Path(file_okay=False, dir_okay=True, writable=True, path_type=Path),
+    help="Where to store attachments, named by attachment id. Defaults to an `attachments` folder in the backup. Point every backup at the same folder to share files between them.",
+)
+@click.option(
+    "--plan",
+    "plan_file",
+    type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path),
+    help="A file written by `backup-airtable plan`. Backs up the bases listed in it instead of every base the token can see.",
+)
+@click.option(
+    "--shard",
+    callback=_parse_shard,
+    metavar="I/N",
+    help="Only back up the Ith of N disjoint sets of bases, so a backup can be split between several processes or machines. Combine their results with `backup-airtable merge`.",
+)
+# for pointing at a stand-in server, like the one in `benchmarks/`
+@click.option("--api-url", envvar="AIRTABLE_API_URL", default=API_URL, hidden=True)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="How many tables to back up at once. Rate limits are per base, so this helps most when backing up many bases.",
+)
+@click.option(
+    "--schedule-from",
+    type=click.Path(
+        exists=True, file_okay=False, dir_okay=True, readable=True, path_type=Path
+    ),
+    help="A previous backup directory. With --concurrency, tables that took longest in it are started first, and progress includes an estimate of how long is left. Defaults to --incremental-from or --dedupe-against, if given.",
+)
+def backup(
     backup_directory: Path,
     ignore_table: tuple[str],
     airtable_token: str,
     include_comments: bool,
+    output_format: OutputFormat,
+    compact: bool,
+    include_field: tuple[tuple[str, str], ...],
+    exclude_field: tuple[tuple[str, str], ...],
+    skip_computed: bool,
+    fields_by_id: bool,
+    compress: Compression,
+    archive: Optional[Path],
+    dedupe_against: Optional[Path],
+    incremental_from: Optional[Path],
+    reuse_comments_from: Optional[Path],
+    resume: bool,
+    max_retries: int,
+    sort_buffer: int,
+    prometheus_textfile: Optional[Path],
+    fast_json: bool,
+    http2: bool,
+    fixed_rate: bool,
+    include_attachments: bool,
+    attachments_dir: Optional[Path],
+    plan_file: Optional[Path],
+    shard: Optional[Shard],
+    api_url: str,
+    concurrency: int,
+    schedule_from: Optional[Path],
 ):
     "Save data from Airtable to a series of local JSON files / folders"
 
-    fetch = build_client(airtable_token)
+    _check_conflicts(backup_directory, output_format, archive, resume, shard)
 
-    print(f"Backing up to {backup_directory}")
-    print("Fetching bases...", end="", flush=True)
+    metrics = RunMetrics()
+    limiter = (
+        RateLimiter()
+        if fixed_rate
+        else AdaptiveRateLimiter(max_in_flight=concurrency * (COMMENT_WORKERS + 1))
+    )
+    fetch = build_client(
+        airtable_token,
+        limiter=limiter,
+        max_retries=max_retries,
+        metrics=metrics,
+        api_url=api_url.rstrip("/"),
+        concurrency=concurrency,
+        http2=http2,
+    )
 
-    base_response: BaseResponse = fetch("/meta/bases")
-    bases = base_response["bases"]
-    num_bases = len(bases)
+    fields = FieldSelection(
+        include=include_field,
+        exclude=exclude_field,
+        skip_computed=skip_computed,
+        by_id=fields_by_id,
+    )
+    options = BackupOptions(
+        include_comments=include_comments,
+        format=output_format,
+        compression=compress,
+        incremental_from=incremental_from,
+        modified_since=read_backup_started_time(incremental_from, fields)
+        if incremental_from
+        else None,
+        comments_from=reuse_comments_from or incremental_from,
+        dedupe_against=dedupe_against,
+        fields=fields,
+        compact=compact,
+        sort_buffer=sort_buffer,
+        json_backend="orjson" if fast_json else "json",
+    )
+    use_json_backend(options.json_backend)
 
-    print(f" done! Found {num_bases}")
+    print(f"{'Resuming' if resume else 'Backing up to'} {backup_directory}")
+    backup_directory.mkdir(parents=True, exist_ok=True)
+    # a resumed backup keeps its original start time, since that's what incremental backups are based on. so do later shards, if they share a directory
+    if not (
+        (resume or shard)
+        and (backup_directory / f"{BACKUP_INFO_FILENAME}.json").exists()
+    ):
+        write_json(
+            backup_directory,
+            BACKUP_INFO_FILENAME,
+            {
+                "startedTime": datetime.now(timezone.utc).isoformat(),
+                "fields": fields.to_json(),
+                "jsonBackend": options.json_backend,
+            },
+        )
 
-    for base_index, base in enumerate(bases):
-        print(f"  ({base_index + 1}/{num_bases}) Fetching info for: {base['name']}")
+    def _filename(name: str) -> str:
+        return shard.filename(name) if shard else name
 
-        base_directory = backup_directory / normalize_name(base["name"])
+    checkpoint = Checkpoint(
+        backup_directory,
+        resume=resume,
+        filename=_filename(CHECKPOINT_FILENAME),
+        options=options.to_json(),
+    )
+    manifest = Manifest(
+        backup_directory, checkpoint.manifest_entries.values(), shard=shard
+    )
+    run = BackupRun(
+        fetch,
+        backup_directory,
+        options,
+        checkpoint=checkpoint,
+        archive=Archive(archive, backup_directory) if archive else None,
+        database=SqliteDatabase(backup_directory / SQLITE_FILENAME)
+        if output_format == "sqlite"
+        else None,
+        metrics=metrics,
+        manifest=manifest,
+        limiter=limiter,
+        attachments=_attachment_store(
+            backup_directory,
+            attachments_dir,
+            incremental_from or dedupe_against,
+            max_retries,
+        )
+        if include_attachments
+        else None,
+        shard=shard,
+    )
 
-        table_response: TableResponse = fetch(f"/meta/bases/{base['id']}/tables")
-        tables = table_response["tables"]
-        num_tables = len(tables)
-        for table_index, table in enumerate(tables):
-            if table["id"] in ignore_table:
-                print(
-                    f"    ({table_index + 1}/{num_tables}) Skipping table: {table['name']}"
-                )
-                continue
+    try:
+        bases = list_bases(fetch, plan_file, shard)
+
+        if concurrency > 1:
+            backup_concurrently(
+                run,
+                bases,
+                ignore_table,
+                concurrency,
+                _table_estimates(schedule_from or incremental_from or dedupe_against),
+            )
+        else:
+            backup_serially(run, bases, ignore_table)
+
+        if run.attachments:
+            _finish_attachments(run)
+        checkpoint.finish()
+        if run.database:
+            run.database.close()
+        manifest.write(
+            backup_directory / f"{BACKUP_INFO_FILENAME}.json",
+            backup_directory / SQLITE_FILENAME,
+        )
+    except BaseException:
+        if run.attachments:
+            run.attachments.close(cancel=True)
+        if run.archive:
+            run.archive.abort()
+        # a report on a failed run is the most useful kind
+        write_run_report(
+            backup_directory,
+            metrics,
+            prometheus_textfile,
+            success=False,
+            filename=_filename(RUN_REPORT_FILENAME),
+        )
+        raise
+    finally:
+        fetch.close()
 
-            print(f"    ({table_index + 1}/{num_tables}) Saving table: {table['name']}")
+    write_run_report(
+        backup_directory,
+        metrics,
+        prometheus_textfile,
+        filename=_filename(RUN_REPORT_FILENAME),
+    )
+    # the archive picks up everything at the root of the backup, so it's closed last
+    if run.archive:
+        run.archive.close()
+        print(f"Wrote {run.archive.path}")
+
+    if fetch.retries:
+        print(f"Retried {fetch.retries} failed request(s)")
+
+
+@cli.command()
+@click.argument(
+    "backup_directory",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True, path_type=Path),
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="How many files to hash at once. Defaults to the number of CPUs.",
+)
+def verify(backup_directory: Path, jobs: Optional[int]):
+    "Check that a backup's files haven't changed since it was made"
+
+    if not (backup_directory / f"{MANIFEST_FILENAME}.json").exists():
+        raise click.ClickException(
+            f"{backup_directory} has no {MANIFEST_FILENAME}.json; only backups made with this version or later can be verified"
+        )
+
+    print(f"Verifying {backup_directory}...", end="", flush=True)
+    problems = verify_backup(backup_directory, jobs)
+    if problems:
+        print(" failed!")
+        for problem in problems:
+            print(f"  {problem}")
+        raise click.ClickException(f"found {len(problems)} problem(s)")
+    print(" done! Every file matches the manifest")
+
+
+@cli.command()
+@click.argument(
+    "plan_file",
+    type=click.Path(file_okay=True, dir_okay=False, writable=True, path_type=Path),
+    default="backup-plan.json",
+)
+@click.option(
+    "--airtable-token",
+    envvar="AIRTABLE_TOKEN",
+    help="Airtable Access Token",
+    required=True,
+)
+@click.option(
+    "--shards",
+    type=click.IntRange(min=1),
+    help="Show how the bases would be split between this many shards.",
+)
+@click.option("--api-url", envvar="AIRTABLE_API_URL", default=API_URL, hidden=True)
+def plan(plan_file: Path, airtable_token: str, shards: Optional[int], api_url: str):
+    "List every base and table to back up, so the work can be split with `backup --plan --shard`"
 
-            table_directory = base_directory / normalize_name(table["name"])
-            table_directory.mkdir(parents=True, exist_ok=True)
+    fetch = build_client(
+        airtable_token, api_url=api_url.rstrip("/"), concurrency=PLAN_WORKERS
+    )
+    try:
+        bases = list_bases(fetch)
+        print(f"Fetching tables for {len(bases)} base(s)...", end="", flush=True)
+        with ThreadPoolExecutor(max_workers=PLAN_WORKERS) as pool:
+            table_responses: list[TableResponse] = list(
+                pool.map(lambda b: fetch(f"/meta/bases/{b['id']}/tables"), bases)
+            )
+        print(" done!")
+    finally:
+        fetch.close()
 
-            write_json(table_directory, "schema", table)
+    planned = [
+        {
+            **base,
+            "tables": [
+                {"id": table["id"], "name": table["name"]}
+                for table in table_response["tables"]
+            ],
+        }
+        for base, table_response in zip(bases, table_responses)
+    ]
+    plan_file.write_bytes(
+        json_backend.dumps(
+            {
+                "createdTime": datetime.now(timezone.utc).isoformat(),
+                "bases": planned,
+            },
+            indent=True,
+        )
+    )
+    num_tables = sum(len(base["tables"]) for base in planned)
+    print(f"Wrote {plan_file}: {num_tables} table(s) in {len(planned)} base(s)")
 
-            print("      loading records", end="", flush=True)
-            records = sorted(
-                load_all_records(fetch, base["id"], table["id"]),
-                key=lambda r: r["createdTime"],
+    if shards:
+        for index in range(1, shards + 1):
+            shard_bases = [
+                b for b in planned if Shard.number_for(b["id"], shards) == index
+            ]
+            print(
+                f"  shard {index}/{shards}: {len(shard_bases)} base(s), {sum(len(b['tables']) for b in shard_bases)} table(s)"
             )
 
-            if include_comments:
-                # only log if we're fetching any comments for this table
-                if num_records_with_comments := sum(
-                    1 for r in records if r.get("commentCount")
-                ):
-                    print(
-                        f"\n      loading comments for {num_records_with_comments} record(s)",
-                        end="",
-                        flush=True,
-                    )
-                else:
-                    print("\n      no comments for this table", flush=True, end="")
-
-                # but, always add the empty lists
-                for record in records:
-                    comments = []
-                    if record.get("commentCount"):
-                        comments = sorted(
-                            load_all_comments(
-                                fetch, base["id"], table["id"], record["id"]
-                            ),
-                            key=lambda r: r["createdTime"],
-                        )
-                    record["comments"] = comments
 
-            write_json(table_directory, "records", records)
-            print("\n      wrote records.json")
+@cli.command()
+@click.argument(
+    "backup_directory",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True, path_type=Path),
+)
+def merge(backup_directory: Path):
+    "Combine the manifests of a backup that was split with --shard"
+
+    path = merge_manifests(backup_directory)
+    print(f"Wrote {path}")
@@ -0,0 +1,168 @@
+"""
+The parts of an Airtable API client that the command line and the async API (`backup_airtable.api`) share: the API's limits and types, rate limiting, and which failures to retry and when. It doesn't depend on click, so embedding the async API doesn't pull in the command line.
+"""
+
+import email.utils
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, TypedDict, Union
+
+import httpx
+from httpx import HTTPError, HTTPStatusError
+
+# airtable occasionally has read timeouts when doing a big export
+# see https://github.com/simonw/airtable-export/pull/14
+timeout = httpx.Timeout(5, read=60)
+# how long an idle connection is kept around; long enough to survive waiting out a rate limit
+KEEPALIVE_EXPIRY = 30.0
+API_URL = "https://api.airtable.com/v0"
+# Airtable allows 5 requests per second, per base
+# see https://airtable.com/developers/web/api/rate-limits
+REQUESTS_PER_SECOND = 5
+# there's also an overall limit for everything a token does, which matters once bases are backed up concurrently
+TOKEN_REQUESTS_PER_SECOND = 50
+# requests that fail for transient reasons (timeouts, 429s, 5xx errors) are retried with exponential backoff
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# airtable asks that clients wait 30 seconds after being rate limited
+RATE_LIMITED_DELAY = 30.0
+# how many records' comments to fetch at once
+COMMENT_WORKERS = 5
+
+
+class Base(TypedDict):
+    id: str
+    name: str
+    permissionLevel: str
+
+
+class Table(TypedDict):
+    id: str
+    name: str
+    primaryFieldId: str
+    fields: list[dict]  # don't need the details here
+
+
+# list values are sent as repeated params (like `fields[]`)
+Params = dict[str, Union[str, list[str], None]]
+
+
+def rate_limit_key(api_path: str) -> str:
+    """
+    Airtable's limits are per base, so group requests by the base they touch. Calls that aren't specific to a base share a bucket.
+    """
+    parts = api_path.strip("/").split("/")
+    if parts[0] == "meta":
+        return parts[2] if len(parts) > 2 and parts[1] == "bases" else "meta"
+    return parts[0]
+
+
+class RateLimiter:
+    """
+    A token bucket per base. Every request spends a token and tokens refill continuously, so the time a request spends in flight counts towards the wait before the next one.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: float = 1):
+        self.rate = rate or REQUESTS_PER_SECOND
+        self.burst = burst
+        self._lock = threading.Lock()
+        # key -> (tokens available, when that was calculated)
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def _rate(self, key: str) -> float:  # noqa: ARG002
+        return self.rate
+
+    def reserve(self, key: str) -> float:
+        """
+        Claim the next slot for `key`, returning how many seconds to wait before using it. `acquire` does the waiting; this is for callers that wait some other way (like `asyncio.sleep`).
+        """
+        with self._lock:
+            now = time.monotonic()
+            rate = self._rate(key)
+            tokens, updated_at = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * rate) - 1
+            # going negative reserves a future slot, so concurrent callers queue up instead of racing
+            self._buckets[key] = (tokens, now)
+
+        return max(0.0, -tokens / rate)
+
+    def acquire(self, key: str) -> None:
+        if wait := self.reserve(key):
+            time.sleep(wait)
+
+    def release(
+        self, key: str, seconds: float, status: Optional[int], kind: str = ""
+    ) -> None:
+        """
+        Called when a request finishes, with how long it took, its status (`None` if there was no response), and what `kind` of request it was (see `latency_key`), since only similar requests' response times can be compared. Only matters for limiters that adapt.
+        """
+
+    def pause(self, key: str, seconds: float) -> None:
+        """
+        Hold back every request for `key` for at least `seconds`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            rate = self._rate(key)
+            tokens, updated_at = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * rate)
+            self._buckets[key] = (min(tokens, 0) - seconds * rate, now)
+
+
+def retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """
+    How long to wait before retrying a failed request: whatever the server asked for, or else an exponential backoff with jitter.
+    """
+    if response is not None:
+        if retry_after := response.headers.get("retry-after"):
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+            # it can also be an http date
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                # a header we can't make sense of gets the usual backoff instead
+                pass
+            else:
+                if retry_at.tzinfo is None:
+                    # http dates are always in UTC
+                    retry_at = retry_at.replace(tzinfo=timezone.utc)
+                return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+        if response.status_code == 429:
+            return RATE_LIMITED_DELAY
+
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+
+def is_retryable(e: HTTPError) -> bool:
+    if isinstance(e, HTTPStatusError):
+        return e.response.status_code in RETRYABLE_STATUS_CODES
+    # timeouts, dropped connections, etc
+    return isinstance(e, httpx.TransportError)
+
+
+class AirtableRequestError(Exception):
+    """
+    A request failed for good (after any retries). The command line reports it as an error instead of a traceback.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def default_headers(airtable_token: str) -> dict[str, str]:
+    return {
+        "Authorization": f"Bearer {airtable_token}",
+        "user-agent": "backup-airtable",
+        # responses are mostly JSON, which compresses well; these are the encodings httpx can always decode
+        "Accept-Encoding": "gzip, deflate",
+    }
@@ -0,0 +1,295 @@
+"""
+A stand-in for the parts of the Airtable API that backup-airtable uses, serving synthetic bases so the tool's throughput can be measured without hitting the real thing.
+"""
+
+import json
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+PAGE_SIZE = 100
+CREATED_START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+FIELD_TYPES = ("singleLineText", "number", "multipleRecordLinks")
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    records: int
+    fields: int = 10
+    # how long each text value is
+    value_size: int = 20
+    # every `comment_every`th record has `comments_per_record` comments; 0 means no comments
+    comment_every: int = 0
+    comments_per_record: int = 3
+
+
+@dataclass(frozen=True)
+class BaseSpec:
+    tables: tuple[TableSpec, ...]
+
+
+def base_id(base_index: int) -> str:
+    return f"app{base_index:014d}"
+
+
+# table and record ids include their base's index, so they're unique across bases like real ones
+def table_id(base_index: int, table_index: int) -> str:
+    return f"tbl{base_index:07d}{table_index:07d}"
+
+
+def field_id(field_index: int) -> str:
+    return f"fld{field_index:014d}"
+
+
+def record_id(base_index: int, table_index: int, record_index: int) -> str:
+    return f"rec{base_index:04d}{table_index:03d}{record_index:07d}"
+
+
+def field_name(field_index: int) -> str:
+    return "Name" if field_index == 0 else f"Field {field_index}"
+
+
+class RateLimiter:
+    """
+    Airtable's limit of 5 requests per second, per base. A full second's worth of requests can arrive at once, so a client that stays under the limit on average never sees a 429.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._lock = threading.Lock()
+        # base id -> (tokens, last refill)
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def allow(self, key: str) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(key, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - allowed, now)
+            return allowed
+
+
+class MockAirtable:
+    """
+    Serves synthetic bases on localhost. Use it as a context manager; `url` is what to pass to `--api-url`.
+    """
+
+    def __init__(
+        self,
+        bases: list[BaseSpec],
+        latency: float = 0.0,
+        requests_per_second: Optional[float] = 5,
+    ):
+        self.bases = bases
+        self.latency = latency
+        self.limiter = RateLimiter(requests_per_second) if requests_per_second else None
+        self.requests = 0
+        self.rate_limited = 0
+        self._stats_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v0"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc: object):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, rate_limited: bool):
+        with self._stats_lock:
+            self.requests += 1
+            self.rate_limited += rate_limited
+
+    def _base(self, app_id: str) -> BaseSpec:
+        return self.bases[int(app_id.removeprefix("app"))]
+
+    def _table_indexes(self, app_id: str, tbl_id: str) -> tuple[int, int]:
+        base_index, table_index = int(tbl_id[3:10]), int(tbl_id[10:])
+        if base_id(base_index) != app_id:
+            # the table belongs to some other base
+            raise ValueError(tbl_id)
+        return base_index, table_index
+
+    def _table(self, app_id: str, tbl_id: str) -> TableSpec:
+        base_index, table_index = self._table_indexes(app_id, tbl_id)
+        return self.bases[base_index].tables[table_index]
+
+    def handle(self, path: str, query: dict[str, list[str]]) -> tuple[int, Any]:
+        """
+        The status and body for a request.
+        """
+        parts = path.removeprefix("/v0/").strip("/").split("/")
+
+        # like the real API, metadata requests count towards their base's limit
+        is_base_meta = len(parts) > 2 and parts[:2] == ["meta", "bases"]
+        rate_limit_key = parts[2] if is_base_meta else parts[0]
+        if (
+            self.limiter
+            and rate_limit_key != "meta"
+            and not self.limiter.allow(rate_limit_key)
+        ):
+            self._count(rate_limited=True)
+            return 429, {"errors": [{"error": "RATE_LIMIT_REACHED"}]}
+        self._count(rate_limited=False)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        try:
+            match parts:
+                case ["meta", "bases"]:
+                    return 200, {"bases": self._list_bases()}
+                case ["meta", "bases", app_id, "tables"]:
+                    return 200, {"tables": self._list_tables(app_id)}
+                case [app_id, tbl_id]:
+                    return 200, self._list_records(app_id, tbl_id, query)
+                case [app_id, tbl_id, rec_id, "comments"]:
+                    return 200, {
+                        "comments": self._list_comments(app_id, tbl_id, rec_id)
+                    }
+        except (IndexError, ValueError):
+            pass
+        return 404, {"error": "NOT_FOUND"}
+
+    def _list_bases(self) -> list[dict]:
+        return [
+            {"id": base_id(i), "name": f"Base {i}", "permissionLevel": "read"}
+            for i in range(len(self.bases))
+        ]
+
+    def _list_tables(self, app_id: str) -> list[dict]:
+        base_index = int(app_id.removeprefix("app"))
+        return [
+            {
+                "id": table_id(base_index, i),
+                "name": f"Table {i}",
+                "primaryFieldId": field_id(0),
+                "fields": [
+                    {
+                        "id": field_id(n),
+                        "name": field_name(n),
+                        "type": FIELD_TYPES[n % len(FIELD_TYPES)],
+                    }
+                    for n in range(table.fields)
+                ],
+                "views": [{"id": "viw00000000000000", "name": "Grid", "type": "grid"}],
+            }
+            for i, table in enumerate(self._base(app_id).tables)
+        ]
+
+    def _list_records(
+        self, app_id: str, tbl_id: str, query: dict[str, list[str]]
+    ) -> dict:
+        table = self._table(app_id, tbl_id)
+        base_index, table_index = self._table_indexes(app_id, tbl_id)
+        start = int(query.get("offset", ["0"])[0])
+        end = min(start + PAGE_SIZE, table.records)
+
+        wanted = set(query.get("fields[]", []))
+        by_id = query.get("returnFieldsByFieldId") == ["true"]
+        fields = [
+            n
+            for n in range(table.fields)
+            if not wanted or {field_id(n), field_name(n)} & wanted
+        ]
+
+        records = [
+            self._record(table, base_index, table_index, index, fields, by_id)
+            for index in range(start, end)
+        ]
+        return {
+            "records": records,
+            **({"offset": str(end)} if end < table.records else {}),
+        }
+
+    def _record(
+        self,
+        table: TableSpec,
+        base_index: int,
+        table_index: int,
+        index: int,
+        fields: list[int],
+        by_id: bool,
+    ) -> dict:
+        values: dict[str, Any] = {}
+        for n in fields:
+            match FIELD_TYPES[n % len(FIELD_TYPES)]:
+                case "singleLineText":
+                    value: Any = f"{index}-{n} ".ljust(table.value_size, "x")
+                case "number":
+                    value = index * n
+                case _:
+                    linked = (index + n) % table.records
+                    value = [record_id(base_index, table_index, linked)]
+            values[field_id(n) if by_id else field_name(n)] = value
+
+        has_comments = table.comment_every and index % table.comment_every == 0
+        return {
+            "id": record_id(base_index, table_index, index),
+            # not in creation order, so the backup has something to sort
+            "createdTime": _timestamp(CREATED_START, (index * 7919) % table.records),
+            "commentCount": table.comments_per_record if has_comments else 0,
+            "fields": values,
+        }
+
+    def _list_comments(self, app_id: str, tbl_id: str, rec_id: str) -> list[dict]:
+        table = self._table(app_id, tbl_id)
+        index = int(rec_id[-7:])
+        if not (table.comment_every and index % table.comment_every == 0):
+            return []
+        return [
+            {
+                "id": f"com{index:010d}{c:04d}",
+                "author": {
+                    "id": "usr00000000000000",
+                    "email": "bench@example.com",
+                    "name": "Bench Mark",
+                },
+                "text": f"comment {c} on {rec_id}",
+                "createdTime": _timestamp(CREATED_START, index * 60 + c),
+                "lastUpdatedTime": None,
+            }
+            for c in range(table.comments_per_record)
+        ]
+
+
+def _timestamp(start: datetime, seconds: int) -> str:
+    return (start + timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _make_handler(mock: MockAirtable) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        # keep connections open between requests, like the real API
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                status, body = 401, {"error": "AUTHENTICATION_REQUIRED"}
+            else:
+                status, body = mock.handle(url.path, parse_qs(url.query))
+
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *_args: object):
+            pass
+
+    return Handler
@@ -0,0 +1,181 @@
+"""
+Runs backup-airtable against a local mock of the Airtable API and reports how fast it went. See the "Benchmarks" section of the README.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import click
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from mock_airtable import BaseSpec, MockAirtable, TableSpec  # noqa: E402
+
+
+@dataclass(frozen=True)
+class Scenario:
+    description: str
+    bases: list[BaseSpec]
+    # extra arguments for backup-airtable
+    args: tuple[str, ...] = ()
+
+
+def scenarios(scale: float) -> dict[str, Scenario]:
+    def _records(n: int) -> int:
+        return max(1, round(n * scale))
+
+    return {
+        "many-small-bases": Scenario(
+            "20 bases with 3 small tables each, backed up concurrently",
+            [BaseSpec((TableSpec(_records(200), fields=8),) * 3)] * 20,
+            ("--concurrency", "8"),
+        ),
+        "huge-table": Scenario(
+            "a single wide table with lots of records",
+            [BaseSpec((TableSpec(_records(10_000), fields=40, value_size=60),))],
+        ),
+        "comment-heavy": Scenario(
+            "a table where every 10th record has comments",
+            [BaseSpec((TableSpec(_records(1_000), fields=8, comment_every=10),))],
+            ("--include-comments",),
+        ),
+    }
+
+
+def run_scenario(
+    name: str, scenario: Scenario, latency: float, backup_args: tuple[str, ...]
+) -> dict:
+    with (
+        MockAirtable(scenario.bases, latency=latency) as mock,
+        tempfile.TemporaryDirectory() as temp_dir,
+    ):
+        backup_directory = Path(temp_dir, "backup")
+        start = time.monotonic()
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from backup_airtable.cli import cli; cli()",
+                str(backup_directory),
+                *scenario.args,
+                *backup_args,
+            ],
+            env={
+                **os.environ,
+                "AIRTABLE_API_URL": mock.url,
+                "AIRTABLE_TOKEN": "patBenchmark.123",
+            },
+            stdout=subprocess.DEVNULL,
+        )
+        # unlike `wait`, this gets the resource usage of just this process
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.monotonic() - start
+        if os.waitstatus_to_exitcode(status):
+            raise click.ClickException(f"{name} failed")
+
+        report = json.loads((backup_directory / "run-report.json").read_text())
+
+    # linux reports kilobytes, macOS bytes
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {
+        "scenario": name,
+        "records": report["records"],
+        "seconds": round(seconds, 2),
+        "recordsPerSecond": round(report["records"] / seconds, 1),
+        "peakRssMb": round(peak_rss / 1024 / 1024, 1),
+        "requests": mock.requests,
+        "rateLimited": mock.rate_limited,
+    }
+
+
+def compare(results: list[dict], baseline_path: Path, max_regression: float) -> bool:
+    baseline = {r["scenario"]: r for r in json.loads(baseline_path.read_text())}
+    ok = True
+    for result in results:
+        if not (previous := baseline.get(result["scenario"])):
+            continue
+        change = result["recordsPerSecond"] / previous["recordsPerSecond"] - 1
+        regressed = change < -max_regression
+        ok &= not regressed
+        click.echo(
+            f"{result['scenario']}: {change:+.1%} records/s vs baseline{' (REGRESSION)' if regressed else ''}"
+        )
+    return ok
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.option(
+    "--scenario",
+    "names",
+    multiple=True,
+    help="Scenario(s) to run. Defaults to all of them.",
+)
+@click.option(
+    "--scale",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="Multiply the number of records in every table.",
+)
+@click.option(
+    "--latency",
+    type=float,
+    default=0.05,
+    show_default=True,
+    help="Seconds the mock server waits before responding.",
+)
+@click.option(
+    "--save", type=click.Path(path_type=Path), help="Write the results to this file."
+)
+@click.option(
+    "--compare",
+    "baseline",
+    type=click.Path(exists=True, path_type=Path),
+    help="Results saved by an earlier run. Exits with an error if any scenario got slower than --max-regression.",
+)
+@click.option("--max-regression", type=float, default=0.1, show_default=True)
+@click.argument("backup_args", nargs=-1, type=click.UNPROCESSED)
+def main(
+    names: tuple[str, ...],
+    scale: float,
+    latency: float,
+    save: Optional[Path],
+    baseline: Optional[Path],
+    max_regression: float,
+    backup_args: tuple[str, ...],
+):
+    """
+    Benchmark backup-airtable against a local mock of the Airtable API. Any BACKUP_ARGS are passed along to every run.
+    """
+    available = scenarios(scale)
+    if unknown := set(names) - set(available):
+        raise click.BadParameter(
+            f"unknown scenario(s): {', '.join(sorted(unknown))}; choose from {', '.join(available)}",
+            param_hint="--scenario",
+        )
+
+    results = []
+    for name in names or available:
+        scenario = available[name]
+        click.echo(f"{name}: {scenario.description}...", nl=False)
+        result = run_scenario(name, scenario, latency, backup_args)
+        results.append(result)
+        click.echo(
+            f" {result['records']} records in {result['seconds']}s ({result['recordsPerSecond']} records/s), peak RSS {result['peakRssMb']} MB, {result['requests']} requests ({result['rateLimited']} rate limited)"
+        )
+
+    if save:
+        save.write_text(json.dumps(results, indent=2) + "\n")
+    if baseline and not compare(results, baseline, max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
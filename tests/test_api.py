@@ -0,0 +1,121 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+from pytest_httpx import HTTPXMock
+
+from backup_airtable import AirtableRequestError, AsyncAirtableClient
+
+API = "https://api.airtable.com/v0"
+
+
+@pytest.fixture(autouse=True)
+def fast_rate_limit(monkeypatch):
+    # tests run against a mock, so there's no reason to wait between requests
+    monkeypatch.setattr("backup_airtable.client.REQUESTS_PER_SECOND", 10_000)
+    monkeypatch.setattr("backup_airtable.api.TOKEN_REQUESTS_PER_SECOND", 10_000)
+
+
+def test_bases_and_tables(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        url=f"{API}/meta/bases",
+        match_headers={"Authorization": "Bearer pat123.456"},
+        json={"bases": [{"id": "app123"}], "offset": "itr1"},
+    )
+    httpx_mock.add_response(
+        url=f"{API}/meta/bases?offset=itr1", json={"bases": [{"id": "app456"}]}
+    )
+    httpx_mock.add_response(
+        url=f"{API}/meta/bases/app123/tables", json={"tables": [{"id": "tbl123"}]}
+    )
+
+    async def _run():
+        async with AsyncAirtableClient("pat123.456") as client:
+            bases = [base["id"] async for base in client.bases()]
+            tables = await client.tables("app123")
+        return bases, tables
+
+    assert asyncio.run(_run()) == (["app123", "app456"], [{"id": "tbl123"}])
+
+
+def test_records_with_comments(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        url=f"{API}/app123/tbl123?recordMetadata=commentCount&fields%5B%5D=Name",
+        json={
+            "records": [{"id": "rec1", "commentCount": 2}, {"id": "rec2"}],
+            "offset": "itr1",
+        },
+    )
+    httpx_mock.add_response(
+        url=f"{API}/app123/tbl123?recordMetadata=commentCount&fields%5B%5D=Name&offset=itr1",
+        json={"records": [{"id": "rec3", "commentCount": 0}]},
+    )
+    httpx_mock.add_response(
+        url=f"{API}/app123/tbl123/rec1/comments",
+        json={
+            "comments": [
+                {"id": "com2", "createdTime": "2025-02-21T08:15:25.000Z"},
+                {"id": "com1", "createdTime": "2025-02-21T08:05:25.000Z"},
+            ]
+        },
+    )
+
+    async def _run():
+        async with AsyncAirtableClient("pat123.456") as client:
+            return [
+                record
+                async for record in client.records(
+                    "app123",
+                    "tbl123",
+                    params={"fields[]": ["Name"]},
+                    include_comments=True,
+                )
+            ]
+
+    records = asyncio.run(_run())
+    assert [r["id"] for r in records] == ["rec1", "rec2", "rec3"]
+    assert [c["id"] for c in records[0]["comments"]] == ["com1", "com2"]
+    assert records[1]["comments"] == records[2]["comments"] == []
+
+
+def test_pages_are_fetched_as_they_are_consumed(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        url=f"{API}/app123/tbl123?recordMetadata=commentCount",
+        json={"records": [{"id": "rec1"}], "offset": "itr1"},
+    )
+
+    async def _run():
+        async with AsyncAirtableClient("pat123.456") as client:
+            async for page in client.record_pages("app123", "tbl123"):
+                return page
+        return None
+
+    assert asyncio.run(_run()) == [{"id": "rec1"}]
+    # the second page was never requested
+    assert len(httpx_mock.get_requests()) == 1
+
+
+def test_retries(httpx_mock: HTTPXMock, monkeypatch):
+    monkeypatch.setattr("backup_airtable.api.retry_delay", lambda *_args: 0)
+    httpx_mock.add_response(url=f"{API}/meta/bases/app123/tables", status_code=502)
+    httpx_mock.add_response(url=f"{API}/meta/bases/app123/tables", json={"tables": []})
+    httpx_mock.add_response(url=f"{API}/meta/bases/app456/tables", status_code=403)
+
+    async def _run():
+        async with AsyncAirtableClient("pat123.456") as client:
+            assert await client.tables("app123") == []
+            assert client.retries == 1
+            with pytest.raises(AirtableRequestError) as info:
+                await client.tables("app456")
+            assert info.value.status_code == 403
+
+    asyncio.run(_run())
+
+
+def test_doesnt_import_the_command_line():
+    code = "import sys, backup_airtable; print('backup_airtable.cli' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
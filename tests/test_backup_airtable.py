@@ -1,13 +1,62 @@
+import gzip
+import hashlib
 import json
+import lzma
+import re
+import sqlite3
+import sys
+import tarfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
 from pathlib import Path
 from typing import Callable, Optional, Protocol, TypedDict
-from unittest.mock import patch
 
+import click
+import httpx
 import pytest
 from click.testing import CliRunner, Result
 from pytest_httpx import HTTPXMock
 
-from backup_airtable.cli import build_client, cli, load_all_comments, load_all_records
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from backup_airtable.cli import (
+    AdaptiveRateLimiter,
+    AttachmentStore,
+    Checkpoint,
+    FieldSelection,
+    JsonBackend,
+    OrjsonBackend,
+    RecordSpool,
+    Shard,
+    TableWriter,
+    _with_comments,
+    attachment_fields,
+    build_client,
+    cli,
+    estimate_remaining,
+    format_duration,
+    latency_key,
+    load_all_comments,
+    load_all_records,
+    load_comments_for_records,
+    longest_first,
+    open_file,
+    read_json_array,
+    write_json,
+    write_json_array,
+)
+from backup_airtable.client import (
+    AirtableRequestError,
+    RateLimiter,
+    Table,
+    rate_limit_key,
+    retry_delay,
+)
 
 
 class TableInfo(TypedDict):
@@ -23,6 +72,28 @@ class BaseInfo(TypedDict):
 type BasesFn = Callable[[], list[BaseInfo]]
 
 
+@pytest.fixture(autouse=True)
+def fast_rate_limit(monkeypatch):
+    # tests run against a mock, so there's no reason to wait between requests
+    monkeypatch.setattr("backup_airtable.client.REQUESTS_PER_SECOND", 10_000)
+    monkeypatch.setattr("backup_airtable.cli.TOKEN_REQUESTS_PER_SECOND", 10_000)
+
+
+@pytest.fixture(
+    params=[
+        "json",
+        pytest.param(
+            "orjson",
+            marks=pytest.mark.skipif(orjson is None, reason="orjson isn't installed"),
+        ),
+    ]
+)
+def json_backend(request, monkeypatch) -> JsonBackend:
+    backend = OrjsonBackend() if request.param == "orjson" else JsonBackend()
+    monkeypatch.setattr("backup_airtable.cli.json_backend", backend)
+    return backend
+
+
 @pytest.fixture
 def get_bases() -> BasesFn:
     """
@@ -168,7 +239,7 @@ def get_bases() -> BasesFn:
             },
             {
                 "info": {
-                    "id": "app123",
+                    "id": "app456",
                     "name": "Base the Second",
                     "permissionLevel": "create",
                 },
@@ -351,7 +422,11 @@ def test_version(invoke: InvokeFn):
 
 
 def test_full_backup(
-    tmp_path, mock_records, bases_no_comments: list[BaseInfo], invoke: InvokeFn
+    tmp_path,
+    json_backend,  # noqa: ARG001
+    mock_records,
+    bases_no_comments: list[BaseInfo],
+    invoke: InvokeFn,
 ):
     mock_records()
     invoke()
@@ -390,10 +465,28 @@ def test_full_backup(
     )
 
 
+def test_compact_backup(tmp_path, mock_records, bases_no_comments, invoke: InvokeFn):
+    mock_records()
+    invoke(["--compact"])
+
+    table_directory = Path(tmp_path, "Base the First", "Cool Table")
+    records = (table_directory / "records.json").read_text()
+    assert "\n" not in records
+    assert json.loads(records) == [
+        bases_no_comments[0]["tables"][0]["records"][1],
+        bases_no_comments[0]["tables"][0]["records"][0],
+    ]
+    assert "\n" not in (table_directory / "schema.json").read_text()
+
+
 def test_full_backup_with_comments(tmp_path, mock_records, bases, invoke: InvokeFn):
     mock_records(with_comments=True)
 
-    invoke(["--include-comments"])
+    result = invoke(["--include-comments"])
+    # tables are saved in the background, but their progress is still shown
+    assert "Saved table: Cool Table" in result.output
+    assert "loading comments for 1 record(s)" in result.output
+    assert "wrote records.json" in result.output
 
     assert json.loads(
         Path(tmp_path, "Base the First", "Cool Table", "records.json").read_text()
@@ -428,6 +521,537 @@ def test_full_backup_with_comments(tmp_path, mock_records, bases, invoke: Invoke
     ]
 
 
+@pytest.mark.parametrize("with_comments", [True, False])
+def test_ndjson_backup(
+    tmp_path, mock_records, get_bases, invoke: InvokeFn, with_comments
+):
+    bases = get_bases()
+    mock_records(with_comments=with_comments)
+    invoke(["--format", "ndjson", *(["--include-comments"] if with_comments else [])])
+
+    if not with_comments:
+        for r in bases[0]["tables"][0]["records"]:
+            r.pop("comments")
+
+    lines = (
+        Path(tmp_path, "Base the First", "Cool Table", "records.ndjson")
+        .read_text()
+        .splitlines()
+    )
+    assert [json.loads(line) for line in lines] == [
+        bases[0]["tables"][0]["records"][1],
+        bases[0]["tables"][0]["records"][0],
+    ]
+    assert ", " not in lines[0]  # compact
+    assert not Path(tmp_path, "Base the First", "Cool Table", "records.json").exists()
+
+
+def test_sqlite_backup(tmp_path, mock_records, bases_no_comments, invoke: InvokeFn):
+    mock_records()
+    invoke(["--format", "sqlite", "--concurrency", "2"])
+
+    assert not Path(tmp_path, "Base the First", "Cool Table", "records.json").exists()
+    assert (
+        json.loads(
+            Path(tmp_path, "Base the First", "Cool Table", "schema.json").read_text()
+        )
+        == bases_no_comments[0]["tables"][0]["info"]
+    )
+
+    db = sqlite3.connect(tmp_path / "backup.sqlite")
+    assert db.execute(
+        "SELECT name, table_id FROM _tables ORDER BY name"
+    ).fetchall() == [
+        ("Base the First/Cool Table", "tbl123"),
+        ("Base the First/Tough: name? / neat", "tbl456"),
+        ("Base the Second/Cool Table", "tbl789"),
+    ]
+
+    cursor = db.execute(
+        'SELECT * FROM "Base the First/Cool Table" ORDER BY createdTime'
+    )
+    assert [c[0] for c in cursor.description] == [
+        "id",
+        "createdTime",
+        "commentCount",
+        "comments",
+        "record",
+        "Name",
+        "Done?",
+    ]
+    rows = cursor.fetchall()
+    assert [json.loads(row[4]) for row in rows] == [
+        bases_no_comments[0]["tables"][0]["records"][1],
+        bases_no_comments[0]["tables"][0]["records"][0],
+    ]
+    assert [row[:4] for row in rows] == [
+        ("rec2", "2020-04-18T18:58:27.000Z", 0, None),
+        ("rec1", "2020-04-19T18:50:27.000Z", 2, None),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("compression", "open_fn"), [("gzip", gzip.open), ("xz", lzma.open)]
+)
+def test_compressed_backup(
+    tmp_path, mock_records, invoke: InvokeFn, compression, open_fn
+):
+    mock_records()
+    invoke(backup_dir=[str(tmp_path / "plain")])
+    invoke(["--compress", compression], backup_dir=[str(tmp_path / "compressed")])
+
+    suffix = ".gz" if compression == "gzip" else ".xz"
+    plain_files = sorted(
+        p.relative_to(tmp_path / "plain") for p in (tmp_path / "plain").glob("*/*/*")
+    )
+    assert len(plain_files) == 6
+    for path in plain_files:
+        compressed = tmp_path / "compressed" / f"{path}{suffix}"
+        with open_fn(compressed) as f:
+            assert f.read() == (tmp_path / "plain" / path).read_bytes()
+
+
+def test_archive(tmp_path, mock_records, bases_no_comments, invoke: InvokeFn):
+    mock_records()
+    invoke(
+        ["--archive", str(tmp_path / "backup.tar.gz")],
+        backup_dir=[str(tmp_path / "staging")],
+    )
+
+    assert not (tmp_path / "staging").exists()
+    with tarfile.open(tmp_path / "backup.tar.gz") as tar:
+        assert sorted(tar.getnames()) == [
+            "staging/Base the First/Cool Table/records.json",
+            "staging/Base the First/Cool Table/schema.json",
+            "staging/Base the First/Tough- name? | neat/records.json",
+            "staging/Base the First/Tough- name? | neat/schema.json",
+            "staging/Base the Second/Cool Table/records.json",
+            "staging/Base the Second/Cool Table/schema.json",
+            "staging/backup-info.json",
+            "staging/manifest.json",
+            "staging/run-report.json",
+        ]
+        records = tar.extractfile("staging/Base the Second/Cool Table/records.json")
+        assert records
+        assert json.load(records) == bases_no_comments[1]["tables"][0]["records"]
+
+
+def test_archive_inside_the_backup(tmp_path, invoke: InvokeFn):
+    (tmp_path / "staging").mkdir()
+    (tmp_path / "staging" / "keep.txt").write_text("hello")
+    result = invoke(
+        ["--archive", str(tmp_path / "staging" / "backup.tar")],
+        expected_status=2,
+        backup_dir=[str(tmp_path / "staging")],
+    )
+    assert "--archive can't be inside BACKUP_DIRECTORY" in result.output
+    assert (tmp_path / "staging" / "keep.txt").read_text() == "hello"
+
+
+def test_failed_archive_is_removed(tmp_path, httpx_mock: HTTPXMock, invoke: InvokeFn):
+    httpx_mock.add_response(
+        url="https://api.airtable.com/v0/meta/bases", status_code=403
+    )
+    invoke(
+        ["--archive", str(tmp_path / "backup.tar")],
+        expected_status=1,
+        backup_dir=[str(tmp_path / "staging")],
+    )
+    assert not (tmp_path / "backup.tar").exists()
+
+
+def test_manifest(tmp_path, mock_records, invoke: InvokeFn):
+    mock_records()
+    invoke()
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert [
+        (t["baseName"], t["tableName"], t["records"]) for t in manifest["tables"]
+    ] == [
+        ("Base the First", "Cool Table", 2),
+        ("Base the First", "Tough: name? / neat", 2),
+        ("Base the Second", "Cool Table", 2),
+    ]
+    files = manifest["tables"][0]["files"]
+    assert sorted(files) == [
+        "Base the First/Cool Table/records.json",
+        "Base the First/Cool Table/schema.json",
+    ]
+    records_file = tmp_path / "Base the First" / "Cool Table" / "records.json"
+    assert files["Base the First/Cool Table/records.json"] == {
+        "bytes": records_file.stat().st_size,
+        "sha256": hashlib.sha256(records_file.read_bytes()).hexdigest(),
+    }
+    assert list(manifest["files"]) == ["backup-info.json"]
+
+
+def test_verify(tmp_path, mock_records, invoke: InvokeFn):
+    mock_records()
+    invoke()
+
+    result = CliRunner().invoke(cli, ["verify", "--jobs", "2", str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    assert "Every file matches the manifest" in result.output
+
+    (tmp_path / "Base the First" / "Cool Table" / "schema.json").unlink()
+    records_file = tmp_path / "Base the Second" / "Cool Table" / "records.json"
+    # same size, different contents
+    records_file.write_text(records_file.read_text().replace("e", "E"))
+
+    result = CliRunner().invoke(cli, ["verify", str(tmp_path)])
+    assert result.exit_code == 1
+    assert "Base the First/Cool Table/schema.json is missing" in result.output
+    assert "Base the Second/Cool Table/records.json has been modified" in result.output
+    assert "found 2 problem(s)" in result.output
+
+
+def test_verify_needs_manifest(tmp_path):
+    result = CliRunner().invoke(cli, ["verify", str(tmp_path)])
+    assert result.exit_code == 1
+    assert "has no manifest.json" in result.output
+
+
+def test_shards_are_disjoint_and_stable():
+    base_ids = [f"app{n:014d}" for n in range(100)]
+    shards = [Shard(index, 3) for index in range(1, 4)]
+    assignments = [
+        [shard for shard in shards if shard.includes({"id": base_id})]  # type: ignore
+        for base_id in base_ids
+    ]
+
+    assert all(len(a) == 1 for a in assignments)
+    # roughly even
+    assert all(20 < sum(a == [shard] for a in assignments) < 50 for shard in shards)
+    assert Shard.number_for("app123", 3) == 1
+
+
+@pytest.mark.parametrize("value", ["0/2", "3/2", "1", "a/b"])
+def test_bad_shard(invoke: InvokeFn, value):
+    result = invoke(["--shard", value], expected_status=2)
+    assert "expected i/n" in result.output
+
+
+@pytest.mark.parametrize(
+    ("option", "message"),
+    [
+        (["--format", "sqlite"], "with --format sqlite"),
+        (["--archive", "backup.tar"], "with --archive"),
+    ],
+)
+def test_shard_conflicts(invoke: InvokeFn, option, message):
+    result = invoke(["--shard", "1/2", *option], expected_status=2)
+    assert message in result.output
+
+
+def test_plan(tmp_path, mock_tables, monkeypatch):  # noqa: ARG001
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(
+        cli, ["plan", "--shards", "2"], env={"AIRTABLE_TOKEN": "pat123.456"}
+    )
+    assert result.exit_code == 0, result.output
+    assert "Wrote backup-plan.json: 3 table(s) in 2 base(s)" in result.output
+    assert "shard 1/2: 1 base(s), 2 table(s)" in result.output
+
+    plan = json.loads((tmp_path / "backup-plan.json").read_text())
+    assert [(b["id"], [t["id"] for t in b["tables"]]) for b in plan["bases"]] == [
+        ("app123", ["tbl123", "tbl456"]),
+        ("app456", ["tbl789"]),
+    ]
+
+
+def test_sharded_backup(tmp_path, mock_records, invoke: InvokeFn):
+    mock_records()
+    for shard in ("2/2", "1/2"):
+        result = invoke(["--shard", shard])
+        assert "Found 2, 1 of which are in shard" in result.output
+
+    assert sorted(p.name for p in tmp_path.glob("*.json")) == [
+        "backup-info.json",
+        "manifest-1-of-2.json",
+        "manifest-2-of-2.json",
+        "run-report-1-of-2.json",
+        "run-report-2-of-2.json",
+    ]
+    second = json.loads((tmp_path / "manifest-2-of-2.json").read_text())
+    assert [t["baseId"] for t in second["tables"]] == ["app456"]
+
+    result = CliRunner().invoke(cli, ["merge", str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert [t["tableId"] for t in manifest["tables"]] == ["tbl123", "tbl456", "tbl789"]
+    assert "shard" not in manifest
+
+    result = CliRunner().invoke(cli, ["verify", str(tmp_path)])
+    assert result.exit_code == 0, result.output
+
+
+def test_merge_needs_every_shard(tmp_path):
+    write_json(tmp_path, "manifest-1-of-2", {"shard": "1/2", "tables": [], "files": {}})
+
+    result = CliRunner().invoke(cli, ["merge", str(tmp_path)])
+    assert result.exit_code == 1
+    assert "missing the manifest for shard(s) 2/2" in result.output
+
+
+# the other base isn't requested
+@pytest.mark.parametrize("assert_all_responses_were_requested", [False])
+def test_backup_from_plan(tmp_path, mock_records, invoke: InvokeFn):
+    mock_records()
+    plan = tmp_path / "plan.json"
+    plan.write_text(
+        json.dumps(
+            {
+                "bases": [
+                    {
+                        "id": "app456",
+                        "name": "Base the Second",
+                        "permissionLevel": "create",
+                        "tables": [],
+                    }
+                ]
+            }
+        )
+    )
+
+    invoke(["--plan", str(plan)], backup_dir=[str(tmp_path / "backup")])
+    assert [p.name for p in (tmp_path / "backup").iterdir() if p.is_dir()] == [
+        "Base the Second"
+    ]
+
+
+def test_dedupe_against_previous_backup(tmp_path, mock_records, invoke: InvokeFn):
+    mock_records()
+    invoke(backup_dir=[str(tmp_path / "previous")])
+    changed = tmp_path / "previous" / "Base the Second" / "Cool Table" / "records.json"
+    changed.write_text("[]")
+
+    invoke(
+        ["--dedupe-against", str(tmp_path / "previous")],
+        backup_dir=[str(tmp_path / "current")],
+    )
+
+    for path in sorted((tmp_path / "previous").glob("*/*/*")):
+        current = tmp_path / "current" / path.relative_to(tmp_path / "previous")
+        assert current.samefile(path) == (path != changed)
+    assert json.loads(
+        (
+            tmp_path / "current" / "Base the Second" / "Cool Table" / "records.json"
+        ).read_text()
+    )
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_writing_never_changes_a_linked_file(tmp_path, compression):
+    (tmp_path / "previous").mkdir()
+    (tmp_path / "current").mkdir()
+    previous = write_json(tmp_path / "previous", "schema", {"a": 1}, compression)
+    current = tmp_path / "current" / previous.name
+    current.hardlink_to(previous)
+
+    write_json(tmp_path / "current", "schema", {"a": 2}, compression)
+    write_json_array(tmp_path / "current", "schema", [{"a": 3}], compression)
+
+    assert not current.samefile(previous)
+    with open_file(previous, "r") as f:
+        assert json.load(f) == {"a": 1}
+
+
+def test_reusing_comments(tmp_path, mock_records, bases, invoke: InvokeFn):
+    previous = tmp_path / "previous" / "Base the First" / "Cool Table"
+    previous.mkdir(parents=True)
+    write_json(previous, "records", bases[0]["tables"][0]["records"])
+
+    # no comments are mocked, so they can only come from the previous backup
+    mock_records()
+    invoke(
+        ["--include-comments", "--reuse-comments-from", str(tmp_path / "previous")],
+        backup_dir=[str(tmp_path / "current")],
+    )
+
+    assert json.loads(
+        Path(
+            tmp_path, "current", "Base the First", "Cool Table", "records.json"
+        ).read_text()
+    ) == [
+        bases[0]["tables"][0]["records"][1],
+        bases[0]["tables"][0]["records"][0],
+    ]
+
+
+def test_comments_are_refetched_when_the_count_changes():
+    fetched = []
+
+    def fetch(path: str, _params=None):
+        fetched.append(path)
+        return {"comments": [{"createdTime": "2025-02-22T00:00:00.000Z"}] * 3}
+
+    records = [
+        {"id": "rec1", "commentCount": 2},
+        {"id": "rec2", "commentCount": 3},
+    ]
+    cache = {"rec1": (2, ["old", "comments"]), "rec2": (2, ["old", "comments"])}
+
+    result = list(_with_comments(fetch, "app123", "tbl123", records, cache))
+
+    assert fetched == ["/app123/tbl123/rec2/comments"]
+    assert result[0]["comments"] == ["old", "comments"]
+    assert len(result[1]["comments"]) == 3
+
+
+class TestFieldSelection:
+    TABLE = {
+        "id": "tbl123",
+        "name": "Games",
+        "primaryFieldId": "fldTitle",
+        "fields": [
+            {"id": "fldTitle", "name": "Title", "type": "formula"},
+            {"id": "fldStyle", "name": "Style", "type": "singleSelect"},
+            {"id": "fldPlays", "name": "Plays", "type": "count"},
+            {"id": "fldScore", "name": "Score", "type": "rollup"},
+        ],
+    }
+
+    def test_everything_by_default(self):
+        assert FieldSelection().fields_for(self.TABLE) is None
+        assert FieldSelection().params(self.TABLE) == {
+            "fields[]": None,
+            "returnFieldsByFieldId": None,
+        }
+
+    def test_skip_computed_keeps_the_primary_field(self):
+        assert FieldSelection(skip_computed=True).fields_for(self.TABLE) == [
+            "fldTitle",
+            "fldStyle",
+        ]
+
+    def test_include_and_exclude(self):
+        selection = FieldSelection(
+            include=(("tbl123", "Style"), ("tbl123", "fldScore"), ("tbl456", "Plays")),
+            exclude=(("tbl123", "Score"),),
+            skip_computed=True,
+        )
+        assert selection.fields_for(self.TABLE) == ["fldStyle"]
+        assert FieldSelection(exclude=(("tbl123", "fldStyle"),)).fields_for(
+            self.TABLE
+        ) == ["fldTitle", "fldPlays", "fldScore"]
+
+    @pytest.mark.parametrize(
+        ("selection", "message"),
+        [
+            (FieldSelection(include=(("tbl123", "Nmae"),)), "no field(s) named 'Nmae'"),
+            (
+                FieldSelection(exclude=(("tbl123", "Sytle"), ("tbl123", "fldNope"))),
+                "no field(s) named 'Sytle', 'fldNope'",
+            ),
+            (
+                FieldSelection(
+                    include=(("tbl123", "Style"),), exclude=(("tbl123", "fldStyle"),)
+                ),
+                "every field of table Games (tbl123) is excluded",
+            ),
+        ],
+    )
+    def test_fields_must_exist(self, selection: FieldSelection, message):
+        with pytest.raises(click.BadParameter, match=re.escape(message)):
+            selection.fields_for(self.TABLE)
+        # other tables aren't affected
+        assert selection.fields_for({**self.TABLE, "id": "tbl456"}) is None
+
+    def test_shards_only_check_their_own_tables(self):
+        selection = FieldSelection(include=(("tbl456", "Plays"),))
+        selection.check([self.TABLE], every_table=False)
+        with pytest.raises(click.BadParameter, match="no table with id 'tbl456'"):
+            selection.check([self.TABLE])
+
+    @pytest.mark.parametrize(
+        ("args", "message"),
+        [
+            (
+                ["--include-field", "tbl123:Nmae"],
+                "Cool Table (tbl123) has no field(s) named 'Nmae'",
+            ),
+            # the last table is checked too, before the first is fetched
+            (
+                ["--exclude-field", "tbl789:Dnoe?"],
+                "Cool Table (tbl789) has no field(s) named 'Dnoe?'",
+            ),
+            (
+                ["--exclude-field", "tbl123:Done?", "--exclude-field", "tbl12:Name"],
+                "there's no table with id 'tbl12'",
+            ),
+        ],
+    )
+    @pytest.mark.parametrize("concurrency", ["1", "2"])
+    def test_mistyped_field(
+        self,
+        tmp_path,
+        httpx_mock: HTTPXMock,
+        mock_tables,  # noqa: ARG002
+        invoke: InvokeFn,
+        args,
+        message,
+        concurrency,
+    ):
+        result = invoke([*args, "--concurrency", concurrency], expected_status=2)
+        assert message in result.output
+        # nothing was downloaded or written
+        assert not any(
+            "recordMetadata" in str(r.url) for r in httpx_mock.get_requests()
+        )
+        assert not (tmp_path / "Base the First").exists()
+
+    def test_projection_is_requested(
+        self,
+        tmp_path,
+        httpx_mock: HTTPXMock,
+        mock_tables,  # noqa: ARG002
+        bases_no_comments: list[BaseInfo],
+        invoke: InvokeFn,
+    ):
+        records = bases_no_comments[0]["tables"][0]["records"]
+        httpx_mock.add_response(
+            url=httpx.URL(
+                "https://api.airtable.com/v0/app123/tbl123",
+                params={
+                    "fields[]": "fld123",
+                    "recordMetadata": "commentCount",
+                    "returnFieldsByFieldId": "true",
+                },
+            ),
+            json={"records": records},
+        )
+
+        invoke(
+            [
+                "--exclude-field",
+                "tbl123:Done?",
+                "--fields-by-id",
+                "--ignore-table",
+                "tbl456",
+                "--ignore-table",
+                "tbl789",
+            ]
+        )
+
+        assert len(
+            json.loads(
+                Path(
+                    tmp_path, "Base the First", "Cool Table", "records.json"
+                ).read_text()
+            )
+        ) == len(records)
+        assert json.loads(Path(tmp_path, "backup-info.json").read_text())["fields"] == {
+            "include": [],
+            "exclude": [["tbl123", "Done?"]],
+            "skipComputed": False,
+            "byId": True,
+        }
+
+    def test_bad_field_option(self, invoke: InvokeFn):
+        result = invoke(["--include-field", "Name"], expected_status=2)
+        assert "expected TABLE_ID:FIELD" in result.output
+
+
 def test_skipping_tables(tmp_path, mock_records, bases_no_comments, invoke: InvokeFn):
     mock_records(["tbl123", "tbl789"])
     invoke(
@@ -459,6 +1083,693 @@ def test_skipping_tables(tmp_path, mock_records, bases_no_comments, invoke: Invo
     assert not Path(tmp_path, "Base the Second", "Cool Table").exists()
 
 
+def test_concurrent_backup_matches_serial(tmp_path, mock_records, invoke: InvokeFn):
+    mock_records(with_comments=True)
+
+    invoke(["--include-comments"], backup_dir=[str(tmp_path / "serial")])
+    result = invoke(
+        ["--include-comments", "--concurrency", "3"],
+        backup_dir=[str(tmp_path / "concurrent")],
+    )
+    assert "Backing up 3 table(s), 3 at a time" in result.output
+
+    serial_files = sorted(
+        p.relative_to(tmp_path / "serial")
+        # backup-info.json has the time the backup was made, so will always differ
+        for p in (tmp_path / "serial").glob("*/*/*")
+    )
+    assert len(serial_files) == 6
+    for path in serial_files:
+        assert (tmp_path / "concurrent" / path).read_bytes() == (
+            tmp_path / "serial" / path
+        ).read_bytes()
+
+
+class TestAttachments:
+    url = "https://v5.airtableusercontent.com/v3/u/att1"
+
+    def attachment(self, attachment_id="att1", size=5) -> dict:
+        return {"id": attachment_id, "url": self.url, "filename": "a.txt", "size": size}
+
+    def test_attachment_fields(self):
+        table: Table = {
+            "id": "tbl123",
+            "name": "Files",
+            "primaryFieldId": "fld1",
+            "fields": [
+                {"id": "fld1", "name": "Name", "type": "singleLineText"},
+                {"id": "fld2", "name": "Photos", "type": "multipleAttachments"},
+            ],
+        }
+        assert attachment_fields(table) == ["Photos"]
+        assert attachment_fields(table, by_id=True) == ["fld2"]
+
+    def test_downloads_each_attachment_once(self, tmp_path, httpx_mock: HTTPXMock):
+        httpx_mock.add_response(url=self.url, content=b"hello")
+        store = AttachmentStore(tmp_path)
+
+        records = [
+            {"id": "rec1", "fields": {"Photos": [self.attachment()]}},
+            {"id": "rec2", "fields": {"Photos": [self.attachment()]}},
+            {"id": "rec3", "fields": {}},
+        ]
+        assert list(store.collect(records, ["Photos"])) == records
+        store.close()
+
+        assert (tmp_path / "att1").read_bytes() == b"hello"
+        assert len(httpx_mock.get_requests()) == 1
+        # the token isn't sent to the CDN
+        assert "Authorization" not in httpx_mock.get_requests()[0].headers
+        assert store.stats() == {
+            "downloaded": 1,
+            "reused": 0,
+            "bytesDownloaded": 5,
+            "failed": 0,
+        }
+
+    def test_reuses_existing_files(self, tmp_path):
+        (tmp_path / "current").mkdir()
+        (tmp_path / "current" / "att1").write_bytes(b"hello")
+        (tmp_path / "previous").mkdir()
+        (tmp_path / "previous" / "att2").write_bytes(b"there")
+
+        store = AttachmentStore(tmp_path / "current", previous=tmp_path / "previous")
+        store.add(self.attachment("att1"))
+        store.add(self.attachment("att2"))
+        store.close()
+
+        assert store.reused == 2
+        assert (tmp_path / "current" / "att2").samefile(tmp_path / "previous" / "att2")
+
+    def test_failures_are_recorded(self, tmp_path, httpx_mock: HTTPXMock):
+        httpx_mock.add_response(url=self.url, status_code=404)
+        httpx_mock.add_response(
+            url="https://v5.airtableusercontent.com/v3/u/att2", content=b"short"
+        )
+        store = AttachmentStore(tmp_path)
+        store.add(self.attachment())
+        store.add(
+            {
+                **self.attachment("att2", size=100),
+                "url": "https://v5.airtableusercontent.com/v3/u/att2",
+            }
+        )
+        store.close()
+
+        not_found, wrong_size = sorted(store.failed)
+        assert not_found.startswith("att1 (a.txt): Client error '404 Not Found'")
+        assert wrong_size == "att2 (a.txt): expected 100 bytes, got 5"
+        assert list(tmp_path.iterdir()) == []
+
+    def test_unparseable_retry_after(
+        self,
+        tmp_path,
+        httpx_mock: HTTPXMock,
+        clock,  # noqa: ARG002
+    ):
+        httpx_mock.add_response(
+            url=self.url, status_code=503, headers={"Retry-After": "soon"}
+        )
+        httpx_mock.add_response(url=self.url, content=b"hello")
+        store = AttachmentStore(tmp_path)
+        store.add(self.attachment())
+        store.close()
+
+        assert store.failed == []
+        assert (tmp_path / "att1").read_bytes() == b"hello"
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson", "sqlite"])
+def test_include_attachments(
+    tmp_path, httpx_mock: HTTPXMock, invoke: InvokeFn, output_format
+):
+    httpx_mock.add_response(
+        url="https://api.airtable.com/v0/meta/bases",
+        json={"bases": [{"id": "app123", "name": "Files", "permissionLevel": "read"}]},
+    )
+    httpx_mock.add_response(
+        url="https://api.airtable.com/v0/meta/bases/app123/tables",
+        json={
+            "tables": [
+                {
+                    "id": "tbl123",
+                    "name": "Photos",
+                    "primaryFieldId": "fld1",
+                    "fields": [
+                        {"id": "fld1", "name": "Photo", "type": "multipleAttachments"}
+                    ],
+                }
+            ]
+        },
+    )
+    attachment = {
+        "id": "att123",
+        "url": "https://v5.airtableusercontent.com/v3/u/att123",
+        "filename": "cat.jpg",
+        "size": 4,
+    }
+    httpx_mock.add_response(
+        url="https://api.airtable.com/v0/app123/tbl123?recordMetadata=commentCount",
+        json={
+            "records": [
+                {
+                    "id": "rec1",
+                    "createdTime": "2020-04-18T18:50:27.000Z",
+                    "commentCount": 0,
+                    "fields": {"Photo": [attachment]},
+                }
+            ]
+        },
+    )
+    httpx_mock.add_response(url=attachment["url"], content=b"meow")
+
+    result = invoke(["--include-attachments", "--format", output_format])
+    assert "Downloaded 1 (0.0 MB), reused 0" in result.output
+    assert (tmp_path / "attachments" / "att123").read_bytes() == b"meow"
+    report = json.loads((tmp_path / "run-report.json").read_text())
+    assert report["attachments"]["downloaded"] == 1
+
+
+def test_longest_tables_go_first():
+    jobs = [({"id": "app1"}, {"id": tid}) for tid in ("tbl1", "tbl2", "tbl3", "tbl4")]
+    estimates = {"tbl1": 5.0, "tbl2": 60.0, "tbl3": 5.0}
+
+    assert [t["id"] for _, t in longest_first(jobs, estimates)] == [  # type: ignore
+        # never seen before, so could be anything
+        "tbl4",
+        "tbl2",
+        # ties keep their order
+        "tbl1",
+        "tbl3",
+    ]
+
+
+@pytest.mark.parametrize(
+    ("estimates", "workers", "expected"),
+    [
+        ([10, 10, 10, 10], 2, 20),
+        ([100, 10, 10], 2, 100),
+        ([], 4, 0),
+    ],
+)
+def test_estimate_remaining(estimates, workers, expected):
+    assert estimate_remaining(estimates, workers) == expected
+
+
+@pytest.mark.parametrize(
+    ("seconds", "expected"), [(4.6, "5s"), (125, "2m 5s"), (3725, "1h 2m")]
+)
+def test_format_duration(seconds, expected):
+    assert format_duration(seconds) == expected
+
+
+def test_schedule_from_previous_backup(tmp_path, mock_records, invoke: InvokeFn):
+    mock_records()
+    previous = tmp_path / "previous"
+    previous.mkdir()
+    write_json(
+        previous,
+        "run-report",
+        {
+            "tables": [
+                {
+                    "tableId": table_id,
+                    "fetchSeconds": seconds,
+                    "commentsSeconds": 0,
+                    "writeSeconds": 1,
+                }
+                for table_id, seconds in (("tbl123", 59), ("tbl456", 119))
+            ]
+        },
+    )
+
+    result = invoke(
+        ["--concurrency", "2", "--schedule-from", str(previous)],
+        backup_dir=[str(tmp_path / "current")],
+    )
+    # tbl789 is new, so it's assumed to be average
+    assert "(about 2m 15s based on the previous backup)" in result.output
+    assert "left" in result.output
+
+
+class TestTableWriter:
+    def test_writes_in_order(self):
+        written = []
+        with TableWriter(max_pending=1) as writer:
+            for i in range(5):
+                writer.submit(lambda i=i: written.append(i))
+        assert written == [0, 1, 2, 3, 4]
+
+    def test_errors_are_raised_after_the_fact(self):
+        written = []
+
+        def fail():
+            raise ValueError("disk full")
+
+        writer = TableWriter()
+        writer.submit(fail)
+        writer.submit(lambda: written.append("queued"))
+        with pytest.raises(ValueError, match="disk full"):
+            writer.close()
+        # tables that were already fetched are still written
+        assert written == ["queued"]
+
+    def test_errors_stop_new_tables(self):
+        writer = TableWriter()
+        writer.submit(lambda: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            # once the writer is done with the first job, this raises
+            for _ in range(100):
+                writer.submit(lambda: time.sleep(0.001))
+        with pytest.raises(ZeroDivisionError):
+            writer.close()
+
+    def test_interruptions_skip_waiting_tables(self):
+        started, finish = threading.Event(), threading.Event()
+        events = []
+
+        def slow():
+            started.set()
+            finish.wait()
+            events.append("slow")
+
+        with pytest.raises(KeyboardInterrupt), TableWriter() as writer:
+            writer.submit(slow)
+            writer.submit(
+                lambda: events.append("queued"),
+                cancel=lambda: events.append("cancelled"),
+            )
+            started.wait()
+            # let the first table finish once the interruption has happened
+            threading.Timer(0.05, finish.set).start()
+            raise KeyboardInterrupt
+        # the table being written is finished, but the one waiting isn't started
+        assert events == ["slow", "cancelled"]
+
+    def test_failed_writes_fail_the_backup(
+        self,
+        httpx_mock: HTTPXMock,
+        mock_tables,  # noqa: ARG002
+        bases_no_comments: list[BaseInfo],
+        invoke: InvokeFn,
+    ):
+        # records come back fine, but their comments can't be fetched
+        httpx_mock.add_response(
+            url="https://api.airtable.com/v0/app123/tbl123?recordMetadata=commentCount",
+            json={"records": bases_no_comments[0]["tables"][0]["records"]},
+        )
+        httpx_mock.add_response(
+            url="https://api.airtable.com/v0/app123/tbl123/rec1/comments",
+            status_code=404,
+        )
+
+        result = invoke(
+            [
+                "--include-comments",
+                "--ignore-table",
+                "tbl456",
+                "--ignore-table",
+                "tbl789",
+            ],
+            expected_status=1,
+        )
+        assert "404 Not Found" in result.output
+
+
+def test_parallel_comments_are_attached_to_the_right_records():
+    def fetch(path: str, _params=None):
+        record_id = path.split("/")[3]
+        # finish out of order, so results can't just be attached as they arrive
+        time.sleep(0.01 if record_id == "rec1" else 0)
+        return {
+            "comments": [
+                {"createdTime": "2025-02-22T00:00:00.000Z", "text": f"{record_id} b"},
+                {"createdTime": "2025-02-21T00:00:00.000Z", "text": f"{record_id} a"},
+            ]
+        }
+
+    records = [
+        {"id": f"rec{i}", "commentCount": 0 if i == 2 else 2} for i in range(1, 6)
+    ]
+    load_comments_for_records(fetch, "app123", "tbl123", records)
+
+    assert [[c["text"] for c in r["comments"]] for r in records] == [
+        ["rec1 a", "rec1 b"],
+        [],
+        ["rec3 a", "rec3 b"],
+        ["rec4 a", "rec4 b"],
+        ["rec5 a", "rec5 b"],
+    ]
+
+
+@pytest.mark.parametrize(
+    "items",
+    [
+        [],
+        [{"id": "rec1"}],
+        [{"b": [1, {"c": None}], "a": "line\nbreak ✨"}, {"id": "rec2", "fields": {}}],
+    ],
+)
+@pytest.mark.parametrize("compact", [False, True])
+def test_streamed_json_matches_write_json(tmp_path, json_backend, items, compact):  # noqa: ARG001
+    write_json(tmp_path, "expected", items, compact=compact)
+    write_json_array(tmp_path, "streamed", iter(items), compact=compact)
+
+    assert (tmp_path / "streamed.json").read_bytes() == (
+        tmp_path / "expected.json"
+    ).read_bytes()
+    assert json.loads((tmp_path / "streamed.json").read_bytes()) == items
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson isn't installed")
+@pytest.mark.parametrize("indent", [False, True])
+@pytest.mark.parametrize("sort_keys", [False, True])
+def test_json_backends_match(indent, sort_keys):
+    data = {
+        "z": [1, 2.5, 1.5e16, None, True],
+        "a": {"text": 'line\nbreak \u0001 "quoted"', "empty": {}, "list": []},
+    }
+    assert OrjsonBackend().dumps(
+        data, indent=indent, sort_keys=sort_keys
+    ) == JsonBackend().dumps(data, indent=indent, sort_keys=sort_keys)
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson isn't installed")
+def test_json_backend_differences():
+    # the standard library escapes non-ascii text, like earlier versions did
+    assert JsonBackend().dumps(["✨"]) == b'["\\u2728"]'
+    assert OrjsonBackend().dumps(["✨"]) == '["✨"]'.encode()
+    # orjson writes floats in their shortest form...
+    assert OrjsonBackend().dumps([1.5e-7]) == b"[1.5e-7]"
+    assert JsonBackend().dumps([1.5e-7]) == b"[1.5e-07]"
+    # ...and reads integers that don't fit in 64 bits as floats
+    body = b"[12345678901234567890123]"
+    assert OrjsonBackend().loads(body) == [1.2345678901234568e22]
+    assert JsonBackend().loads(body) == [12345678901234567890123]
+    # though it can still write them, with the standard library's help
+    assert OrjsonBackend().dumps([12345678901234567890123]) == body
+
+
+def test_default_json_is_unchanged(tmp_path):
+    data = {"z": [1, 2.5], "a": {"text": "line\nbreak ✨", "empty": {}}}
+    write_json(tmp_path, "data", data)
+    # what every earlier version wrote
+    assert (tmp_path / "data.json").read_text() == json.dumps(
+        data, indent=2, sort_keys=True
+    )
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson isn't installed")
+def test_fast_json(
+    tmp_path, mock_records, bases_no_comments, invoke: InvokeFn, monkeypatch
+):
+    # restored after the test, since --fast-json switches it for everything
+    monkeypatch.setattr("backup_airtable.cli.json_backend", JsonBackend())
+    mock_records()
+    invoke(["--fast-json"])
+
+    info = json.loads((tmp_path / "backup-info.json").read_text())
+    assert info["jsonBackend"] == "orjson"
+    assert (
+        json.loads(
+            (tmp_path / "Base the Second" / "Cool Table" / "records.json").read_text()
+        )
+        == bases_no_comments[1]["tables"][0]["records"]
+    )
+
+
+def test_fast_json_requires_orjson(monkeypatch, invoke: InvokeFn):
+    monkeypatch.setattr("backup_airtable.cli.orjson", None)
+    result = invoke(["--fast-json"], expected_status=2)
+    assert "install 'backup-airtable[fast]'" in result.output
+
+
+def test_lone_surrogates(tmp_path, json_backend):
+    # airtable will happily return half of an emoji
+    body = (
+        b'{"records": [{"id": "rec1", "createdTime": "2025-02-21T08:05:25.000Z",'
+        b' "text": "broken \\ud83d emoji"}]}'
+    )
+    records = json_backend.loads(body)["records"]
+    assert records[0]["text"] == "broken \ud83d emoji"
+
+    with RecordSpool(tmp_path) as spool:
+        spool.extend(records)
+        write_json_array(tmp_path, "records", spool)
+
+    assert b"broken \\ud83d emoji" in (tmp_path / "records.json").read_bytes()
+    assert list(read_json_array(tmp_path / "records.json")) == records
+
+
+def test_reading_json_array_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr("backup_airtable.cli.READ_CHUNK_SIZE", 7)
+    items = [{"id": f"rec{i}", "text": "a, ] string" * i} for i in range(5)]
+    write_json_array(tmp_path, "records", items)
+
+    assert list(read_json_array(tmp_path / "records.json")) == items
+
+    write_json_array(tmp_path, "empty", [])
+    assert list(read_json_array(tmp_path / "empty.json")) == []
+
+
+# small buffers sort in runs on disk, which are merged back together
+@pytest.mark.parametrize("sort_buffer", [100, 1, 3])
+def test_spool_sorts_by_created_time(tmp_path, sort_buffer):
+    with RecordSpool(tmp_path, sort_buffer=sort_buffer) as spool:
+        spool.extend(
+            [
+                {"id": "rec1", "createdTime": "2020-04-19T18:50:27.000Z"},
+                {"id": "rec2", "createdTime": "2020-04-18T18:50:27.000Z"},
+            ]
+        )
+        spool.extend(
+            [
+                {"id": "rec3", "createdTime": "2020-04-19T18:50:27.000Z"},
+                {"id": "rec4", "createdTime": "2020-04-17T18:50:27.000Z"},
+            ]
+        )
+
+        assert len(spool) == 4
+        # ties keep the order they were fetched in
+        assert [r["id"] for r in spool] == ["rec4", "rec2", "rec1", "rec3"]
+        # again, now that everything's been sorted
+        assert [r["id"] for r in spool] == ["rec4", "rec2", "rec1", "rec3"]
+
+    # nothing is left behind in the table's folder
+    assert list(tmp_path.iterdir()) == []
+
+
+class TestIncremental:
+    @pytest.fixture
+    def previous_backup(self, tmp_path, bases_no_comments: list[BaseInfo]) -> Path:
+        previous = tmp_path / "previous"
+        table = bases_no_comments[0]["tables"][1]
+        table_directory = previous / "Base the First" / "Tough- name? | neat"
+        table_directory.mkdir(parents=True)
+        write_json(
+            previous, "backup-info", {"startedTime": "2025-01-01T00:00:00+00:00"}
+        )
+        write_json(table_directory, "schema", table["info"])
+        write_json(table_directory, "records", table["records"])
+        return previous
+
+    def test_incremental_backup(
+        self,
+        tmp_path,
+        httpx_mock: HTTPXMock,
+        mock_tables,  # noqa: ARG002
+        previous_backup: Path,
+        bases_no_comments: list[BaseInfo],
+        invoke: InvokeFn,
+    ):
+        rec1, _ = bases_no_comments[0]["tables"][1]["records"]
+        # rec2 was deleted and rec3 is new
+        rec3 = {
+            "id": "rec3",
+            "commentCount": 1,
+            "fields": {"name": "new!"},
+            "createdTime": "2025-01-02T00:00:00.000Z",
+        }
+        httpx_mock.add_response(
+            url=httpx.URL(
+                "https://api.airtable.com/v0/app123/tbl456",
+                params={"fields[]": "fld456", "recordMetadata": "commentCount"},
+            ),
+            json={"records": [{**rec1, "fields": {}}, {**rec3, "fields": {}}]},
+        )
+        httpx_mock.add_response(
+            url=httpx.URL(
+                "https://api.airtable.com/v0/app123/tbl456",
+                params={
+                    "filterByFormula": "OR(IS_AFTER(LAST_MODIFIED_TIME(), '2024-12-31T23:55:00.000Z'), IS_AFTER(CREATED_TIME(), '2024-12-31T23:55:00.000Z'))",
+                    "recordMetadata": "commentCount",
+                },
+            ),
+            json={"records": [rec3]},
+        )
+
+        invoke(
+            [
+                "--incremental-from",
+                str(previous_backup),
+                "--ignore-table",
+                "tbl123",
+                "--ignore-table",
+                "tbl789",
+            ],
+            backup_dir=[str(tmp_path / "current")],
+        )
+
+        assert json.loads(
+            Path(
+                tmp_path,
+                "current",
+                "Base the First",
+                "Tough- name? | neat",
+                "records.json",
+            ).read_text()
+        ) == [rec1, rec3]
+
+    def test_changed_schema_fetches_everything(
+        self,
+        tmp_path,
+        httpx_mock: HTTPXMock,
+        mock_records,
+        previous_backup: Path,
+        bases_no_comments: list[BaseInfo],
+        invoke: InvokeFn,
+    ):
+        table_directory = previous_backup / "Base the First" / "Tough- name? | neat"
+        write_json(table_directory, "schema", {"id": "tbl456", "fields": []})
+        mock_records(["tbl123", "tbl789"])
+
+        invoke(
+            [
+                "--incremental-from",
+                str(previous_backup),
+                "--ignore-table",
+                "tbl123",
+                "--ignore-table",
+                "tbl789",
+            ],
+            backup_dir=[str(tmp_path / "current")],
+        )
+
+        assert not any(
+            "filterByFormula" in r.url.params for r in httpx_mock.get_requests()
+        )
+        assert (
+            json.loads(
+                Path(
+                    tmp_path,
+                    "current",
+                    "Base the First",
+                    "Tough- name? | neat",
+                    "records.json",
+                ).read_text()
+            )
+            == bases_no_comments[0]["tables"][1]["records"]
+        )
+
+    def test_requires_matching_fields(
+        self, tmp_path, previous_backup: Path, invoke: InvokeFn
+    ):
+        result = invoke(
+            ["--incremental-from", str(previous_backup), "--skip-computed"],
+            expected_status=2,
+            backup_dir=[str(tmp_path / "current")],
+        )
+        assert "different field options" in result.output
+
+    def test_requires_backup_info(self, tmp_path, invoke: InvokeFn):
+        result = invoke(["--incremental-from", str(tmp_path)], expected_status=2)
+        assert "missing backup-info.json" in result.output
+
+
+def test_resuming_an_interrupted_backup(
+    tmp_path,
+    httpx_mock: HTTPXMock,
+    mock_tables,  # noqa: ARG001
+    bases_no_comments,
+    invoke: InvokeFn,
+):
+    first_table, second_table = bases_no_comments[0]["tables"]
+    httpx_mock.add_response(
+        url="https://api.airtable.com/v0/app123/tbl123?recordMetadata=commentCount",
+        json={"records": first_table["records"]},
+    )
+    httpx_mock.add_response(
+        url="https://api.airtable.com/v0/app123/tbl456?recordMetadata=commentCount",
+        json={"records": second_table["records"][:1], "offset": "itr1/rec1"},
+    )
+    second_page = "https://api.airtable.com/v0/app123/tbl456?recordMetadata=commentCount&offset=itr1%2Frec1"
+    httpx_mock.add_response(url=second_page, status_code=404)
+    httpx_mock.add_response(
+        url=second_page, json={"records": second_table["records"][1:]}
+    )
+
+    invoke(["--ignore-table", "tbl789"], expected_status=1)
+    table_directory = tmp_path / "Base the First" / "Tough- name? | neat"
+    checkpoint = json.loads((tmp_path / "checkpoint.json").read_text())
+    assert checkpoint["options"]["format"] == "json"
+    assert checkpoint["inProgress"] == {
+        "tbl456": {
+            "offset": "itr1/rec1",
+            "spoolSize": (table_directory / ".records.spool").stat().st_size,
+        }
+    }
+    # finished tables are kept separately, so the checkpoint stays small
+    finished = (tmp_path / "checkpoint.tables.ndjson").read_text().splitlines()
+    assert [json.loads(line)["tableId"] for line in finished] == ["tbl123"]
+    num_requests = len(httpx_mock.get_requests())
+
+    # the rest has to be saved the same way as what's already there
+    result = invoke(
+        ["--ignore-table", "tbl789", "--resume", "--compact"], expected_status=2
+    )
+    assert "checkpoint.json was made with different options" in result.output
+    assert len(httpx_mock.get_requests()) == num_requests
+
+    result = invoke(["--ignore-table", "tbl789", "--resume"])
+    assert "Already saved table: Cool Table" in result.output
+    assert "resuming after 1 records" in result.output
+
+    # only the remaining page was fetched
+    new_requests = httpx_mock.get_requests()[num_requests:]
+    assert [
+        (r.url.path, r.url.params.get("offset"))
+        for r in new_requests
+        if not r.url.path.startswith("/v0/meta")
+    ] == [("/v0/app123/tbl456", "itr1/rec1")]
+    assert (
+        json.loads((table_directory / "records.json").read_text())
+        == second_table["records"]
+    )
+    assert not (tmp_path / "checkpoint.json").exists()
+    assert not (tmp_path / "checkpoint.tables.ndjson").exists()
+    # the table saved before the interruption is still in the manifest
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert [t["tableId"] for t in manifest["tables"]] == ["tbl123", "tbl456"]
+    assert not (table_directory / ".records.spool").exists()
+
+
+def test_checkpoint_drops_a_partially_written_table(tmp_path):
+    checkpoint = Checkpoint(tmp_path)
+    checkpoint.page_saved("tbl123", "itr1", 100)
+    checkpoint.table_done("tbl123", {"tableId": "tbl123"})
+    checkpoint.page_saved("tbl456", "itr1", 100)
+    # interrupted while appending the next table
+    with checkpoint.tables_path.open("a") as f:
+        f.write('{"tableId": "tbl4')
+
+    resumed = Checkpoint(tmp_path, resume=True)
+    assert resumed.completed == {"tbl123"}
+    assert resumed.manifest_entries == {"tbl123": {"tableId": "tbl123"}}
+    assert resumed.in_progress == {"tbl456": {"offset": "itr1", "spoolSize": 100}}
+    resumed.table_done("tbl456")
+    assert Checkpoint(tmp_path, resume=True).completed == {"tbl123", "tbl456"}
+
+
 @pytest.mark.freeze_time("2024-04-24")
 def test_default_path(tmp_path, mock_records, invoke: InvokeFn):
     mock_records()
@@ -467,6 +1778,23 @@ def test_default_path(tmp_path, mock_records, invoke: InvokeFn):
     assert Path(tmp_path, "airtable-backup-2024-04-24").exists()
 
 
+def test_requests_ask_for_compression(httpx_mock: HTTPXMock):
+    httpx_mock.add_response(json={"bases": []})
+    build_client("pat123.456", concurrency=4)("/meta/bases")
+
+    request = httpx_mock.get_request()
+    assert request
+    assert request.headers["Accept-Encoding"] == "gzip, deflate"
+    assert request.headers["Authorization"] == "Bearer pat123.456"
+
+
+def test_http2_requires_h2(monkeypatch, invoke: InvokeFn):
+    # makes `import h2` fail, whether or not it's installed
+    monkeypatch.setitem(sys.modules, "h2", None)
+    result = invoke(["--http2"], expected_status=2)
+    assert "install 'backup-airtable[http2]'" in result.output
+
+
 def test_airtable_export_401_error(httpx_mock, invoke: InvokeFn):
     httpx_mock.add_response(status_code=401)
     result = invoke(expected_status=1)
@@ -475,6 +1803,56 @@ def test_airtable_export_401_error(httpx_mock, invoke: InvokeFn):
     assert "HINT: Ensure" not in result.output
 
 
+def test_run_report(tmp_path, mock_records, invoke: InvokeFn):
+    mock_records(with_comments=True)
+    invoke(
+        [
+            "--include-comments",
+            "--prometheus-textfile",
+            str(tmp_path / "backup.prom"),
+        ],
+        backup_dir=[str(tmp_path / "backup")],
+    )
+
+    report = json.loads((tmp_path / "backup" / "run-report.json").read_text())
+    assert report["success"]
+    assert report["records"] == 6
+    assert {kind: r["count"] for kind, r in report["requests"].items()} == {
+        "comments": 1,
+        "meta": 3,
+        "records": 3,
+    }
+    assert report["requests"]["records"]["statuses"] == {"200": 3}
+    assert report["requests"]["records"]["bytes"] > 0
+    assert [
+        (t["tableId"], t["records"], t["pages"], t["commentRequests"])
+        for t in report["tables"]
+    ] == [("tbl123", 2, 1, 1), ("tbl456", 2, 1, 0), ("tbl789", 2, 1, 0)]
+    assert report["tables"][0]["bytesWritten"] == sum(
+        p.stat().st_size
+        for p in (tmp_path / "backup" / "Base the First" / "Cool Table").iterdir()
+    )
+
+    prometheus = (tmp_path / "backup.prom").read_text().splitlines()
+    assert "# TYPE backup_airtable_success gauge" in prometheus
+    assert "backup_airtable_success 1" in prometheus
+    assert "backup_airtable_records 6" in prometheus
+    assert 'backup_airtable_requests{kind="records",status="200"} 3' in prometheus
+    assert (
+        'backup_airtable_table_records{base="Base the First",table="Tough: name? / neat"} 2'
+        in prometheus
+    )
+
+
+def test_run_report_on_failure(tmp_path, httpx_mock, invoke: InvokeFn):
+    httpx_mock.add_response(status_code=401)
+    invoke(expected_status=1)
+
+    report = json.loads((tmp_path / "run-report.json").read_text())
+    assert not report["success"]
+    assert report["requests"]["meta"]["statuses"] == {"401": 1}
+
+
 def test_airtable_bad_permissions(httpx_mock, invoke: InvokeFn):
     httpx_mock.add_response(status_code=403)
     result = invoke(expected_status=1)
@@ -483,7 +1861,6 @@ def test_airtable_bad_permissions(httpx_mock, invoke: InvokeFn):
     assert "HINT: Ensure" in result.output
 
 
-@patch("backup_airtable.cli.REQUEST_DELAY", new=0)
 class TestPagination:
     def test_paging_records(self, httpx_mock: HTTPXMock):
         headers = {
@@ -538,3 +1915,208 @@ class TestPagination:
         fetch = build_client("pat456.789")
         comments = load_all_comments(fetch, "app123", "tbl123", "rec123")
         assert list(comments) == [{"id": 1}, {"id": 2}, {"id": 3}]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr("backup_airtable.cli.time.monotonic", clock.monotonic)
+    monkeypatch.setattr("backup_airtable.cli.time.sleep", clock.sleep)
+    return clock
+
+
+class TestRateLimiter:
+    def test_spaces_out_requests(self, clock: FakeClock):
+        limiter = RateLimiter(rate=5)
+
+        for _ in range(3):
+            limiter.acquire("app123")
+
+        assert clock.sleeps == [pytest.approx(0.2), pytest.approx(0.2)]
+
+    def test_request_time_counts_towards_wait(self, clock: FakeClock):
+        limiter = RateLimiter(rate=5)
+
+        limiter.acquire("app123")
+        clock.now += 0.15  # a slow response
+        limiter.acquire("app123")
+
+        assert clock.sleeps == [pytest.approx(0.05)]
+
+    def test_bases_are_limited_separately(self, clock: FakeClock):
+        limiter = RateLimiter(rate=5)
+
+        limiter.acquire("app123")
+        limiter.acquire("app456")
+
+        assert clock.sleeps == []
+
+    @pytest.mark.parametrize(
+        ("path", "key"),
+        [
+            ("/meta/bases", "meta"),
+            ("/meta/bases/app123/tables", "app123"),
+            ("/app123/tbl123", "app123"),
+            ("/app123/tbl123/rec123/comments", "app123"),
+        ],
+    )
+    def test_rate_limit_key(self, path, key):
+        assert rate_limit_key(path) == key
+
+
+class TestAdaptiveRateLimiter:
+    def test_slows_down_when_rate_limited(self, clock: FakeClock):
+        limiter = AdaptiveRateLimiter(rate=5, max_in_flight=4)
+
+        limiter.acquire("app123")
+        limiter.release("app123", 0.1, 429)
+        assert limiter.describe("app123") == "2.5 requests/s, up to 2 at once"
+        # other bases are unaffected
+        assert limiter.describe("app456") == "5 requests/s, up to 4 at once"
+
+        # a response that was already in flight doesn't count twice
+        limiter.acquire("app123")
+        limiter.release("app123", 0.1, 429)
+        assert limiter.describe("app123") == "2.5 requests/s, up to 2 at once"
+
+        clock.now += 5
+        limiter.acquire("app123")
+        limiter.release("app123", 0.1, None)
+        assert limiter.describe("app123") == "1.25 requests/s, up to 1 at once"
+
+    def test_speeds_back_up(self, clock: FakeClock):
+        limiter = AdaptiveRateLimiter(rate=5, max_in_flight=4)
+        limiter.acquire("app123")
+        limiter.release("app123", 0.1, 503)
+
+        for _ in range(20):
+            limiter.acquire("app123")
+            limiter.release("app123", 0.1, 200)
+            clock.now += 1
+
+        # but never past where it started
+        assert limiter.describe("app123") == "5 requests/s, up to 4 at once"
+
+    def test_slows_down_for_slow_responses(self, clock: FakeClock):  # noqa: ARG002
+        limiter = AdaptiveRateLimiter(rate=5, max_in_flight=4)
+        for seconds in (0.1, 0.1, 0.3, 1.0):
+            limiter.acquire("app123")
+            limiter.release("app123", seconds, 200)
+
+        assert limiter.describe("app123") == "2.5 requests/s, up to 2 at once"
+
+    def test_compares_like_with_like(self, clock: FakeClock):  # noqa: ARG002
+        limiter = AdaptiveRateLimiter(rate=5, max_in_flight=4)
+        for seconds, kind in ((0.1, "comments"), (1.0, "records")):
+            limiter.acquire("app123")
+            limiter.release("app123", seconds, 200, kind)
+
+        assert limiter.describe("app123") == "5 requests/s, up to 4 at once"
+
+    def test_gets_used_to_slower_responses(self, clock: FakeClock):
+        limiter = AdaptiveRateLimiter(rate=5, max_in_flight=4)
+        # a narrow table's pages are quick, and then the next one's aren't
+        for seconds in [0.1] * 3 + [0.5] * 20:
+            limiter.acquire("app123")
+            limiter.release("app123", seconds, 200, "app123/tbl123")
+            clock.now += seconds
+
+        assert limiter.describe("app123") == "5 requests/s, up to 4 at once"
+
+    def test_latency_key(self):
+        assert latency_key("/app123/tbl123") == "app123/tbl123"
+        assert latency_key("/app123/tbl123/rec1/comments") == "app123/tbl123/comments"
+        assert latency_key("/meta/bases/app123/tables") == "meta"
+
+    def test_limits_requests_in_flight(self):
+        limiter = AdaptiveRateLimiter(rate=1000, max_in_flight=1)
+        limiter.acquire("app123")
+
+        acquired = threading.Event()
+        waiter = threading.Thread(
+            target=lambda: (limiter.acquire("app123"), acquired.set())
+        )
+        waiter.start()
+        assert not acquired.wait(0.05)
+
+        limiter.release("app123", 0.01, 200)
+        assert acquired.wait(1)
+        waiter.join()
+
+
+class TestRetries:
+    url = "https://api.airtable.com/v0/app123/tbl123"
+
+    def test_rate_limited_requests_pause_the_base(
+        self, httpx_mock: HTTPXMock, clock: FakeClock
+    ):
+        httpx_mock.add_response(
+            url=self.url, status_code=429, headers={"Retry-After": "3"}
+        )
+        httpx_mock.add_response(url=self.url, json={"records": []})
+
+        fetch = build_client("pat123.456")
+        assert fetch("/app123/tbl123") == {"records": []}
+        assert fetch.retries == 1
+        assert sum(clock.sleeps) >= 3
+
+    def test_transient_errors_are_retried(self, httpx_mock: HTTPXMock, clock):  # noqa: ARG002
+        httpx_mock.add_exception(httpx.ReadTimeout("too slow"), url=self.url)
+        httpx_mock.add_response(url=self.url, status_code=502)
+        httpx_mock.add_response(url=self.url, json={"records": []})
+
+        fetch = build_client("pat123.456")
+        assert fetch("/app123/tbl123") == {"records": []}
+        assert fetch.retries == 2
+
+    def test_gives_up_eventually(self, httpx_mock: HTTPXMock, clock):  # noqa: ARG002
+        httpx_mock.add_response(url=self.url, status_code=503)
+
+        fetch = build_client("pat123.456", max_retries=2)
+        with pytest.raises(AirtableRequestError, match="503 Service Unavailable"):
+            fetch("/app123/tbl123")
+        assert fetch.retries == 2
+        assert len(httpx_mock.get_requests()) == 3
+
+    @pytest.mark.parametrize(
+        "retry_after",
+        [
+            "soon",
+            "Wed, 21 Oct 2015 07:28:00 GMT",
+            # no zone, or an unknown one, comes back without a timezone
+            "Wed, 21 Oct 2015 07:28:00",
+            "Wed, 21 Oct 2015 07:28:00 -0000",
+            "Wed, 99 Oct 2015 07:28:00 GMT",
+        ],
+    )
+    def test_retry_after_that_cant_be_used(self, retry_after):
+        response = httpx.Response(503, headers={"Retry-After": retry_after})
+        assert 0 <= retry_delay(0, response) <= 1
+
+    def test_retry_after_date(self):
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+        response = httpx.Response(
+            503, headers={"Retry-After": format_datetime(retry_at, usegmt=True)}
+        )
+        assert 25 < retry_delay(0, response) <= 30
+
+    def test_client_errors_are_not_retried(self, httpx_mock: HTTPXMock):
+        httpx_mock.add_response(url=self.url, status_code=422)
+
+        fetch = build_client("pat123.456")
+        with pytest.raises(AirtableRequestError, match="422 Unprocessable Entity"):
+            fetch("/app123/tbl123")
+        assert fetch.retries == 0